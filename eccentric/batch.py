@@ -0,0 +1,133 @@
+# Python 3.5
+# Fit base and peak of many stacked flare data sets at once.
+
+import numpy as np
+from .models import (shape_absolute_distance_influence,
+                     shape_inverse_distance_influence,
+                     shape_absolute_distance_influence_with_maj_axis,
+                     shape_inverse_distance_influence_with_maj_axis,
+                     shape_integral)
+from .likelihood import fit_newton
+
+
+def shape_function(model='absolute_distance_influence', major_axis_a=None):
+    """Pick the shape term of an intensity model.
+
+    Parameters:
+    -----------
+    model : str
+        "absolute_distance_influence" or "inverse_distance_influence"
+    major_axis_a : float, array or None
+        If None, the shape only depends on the eccentricity.
+
+    Return:
+    -------
+    shape function of (time, eccentricity, major_axis_a)
+    """
+    shapes = {("absolute_distance_influence", False): shape_absolute_distance_influence,
+              ("inverse_distance_influence", False): shape_inverse_distance_influence,
+              ("absolute_distance_influence", True): shape_absolute_distance_influence_with_maj_axis,
+              ("inverse_distance_influence", True): shape_inverse_distance_influence_with_maj_axis}
+    if (model, major_axis_a is not None) not in shapes.keys():
+        raise KeyError('Name not available among models. Use "absolute_distance_influence"'
+                       ' or "inverse_distance_influence" instead.')
+    return shapes[(model, major_axis_a is not None)]
+
+
+def pad_ragged(data, offsets=None):
+    """Bring ragged event phase arrays into a
+    NaN-padded 2D array.
+
+    Parameters:
+    -----------
+    data : list of arrays, 2D array, or 1D array
+        Event phases per data set. A 2D array is
+        taken to be padded with NaN already. A 1D array
+        is split at offsets.
+    offsets : array or None
+        n_sets + 1 indices into a 1D data array,
+        data set k is data[offsets[k]:offsets[k+1]]
+
+    Return:
+    -------
+    2D array of shape (n_sets, max. number of events)
+    """
+    if offsets is not None:
+        data = np.asarray(data, dtype=float)
+        offsets = np.asarray(offsets)
+        counts = np.diff(offsets)
+        padded = np.full((len(counts), counts.max(initial=0)), np.nan)
+        rows = np.repeat(np.arange(len(counts)), counts)
+        columns = np.arange(offsets[-1] - offsets[0]) - np.repeat(offsets[:-1] - offsets[0], counts)
+        padded[rows, columns] = data[offsets[0]:offsets[-1]]
+        return padded
+    elif isinstance(data, np.ndarray) and data.ndim == 2:
+        return data.astype(float)
+    else:
+        data = [np.asarray(d, dtype=float) for d in data]
+        counts = np.array([len(d) for d in data], dtype=int)
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return pad_ragged(np.concatenate(data + [np.array([])]), offsets)
+
+
+def fit_batch(data, eccentricity, n_orbits, offsets=None, major_axis_a=None,
+              model='absolute_distance_influence', return_likelihood=False,
+              tol=1e-10, maxiter=100):
+    """Maximum likelihood estimates of base and peak
+    for many stacked flare data sets in one vectorized pass.
+    Gives the same results as :func:`SPI_Model.estimate_two_parameters`
+    on each data set.
+
+    Parameters:
+    -----------
+    data : list of arrays, 2D array padded with NaN, or 1D array
+        Stacked event phases between 0 and 1 per data set.
+    eccentricity : float or array
+        eccentricity per data set
+    n_orbits : float or array
+        number of orbits stacked per data set
+    offsets : array or None
+        n_sets + 1 indices if data is a 1D array
+        of all data sets concatenated
+    major_axis_a : float, array or None
+        major axis per data set, if None the models
+        only depend on the eccentricity
+    model : str
+        "absolute_distance_influence" or "inverse_distance_influence"
+    return_likelihood : bool
+        If True, return the negative log likelihood
+        at the estimates, too.
+    tol : float
+        relative tolerance on the parameters
+    maxiter : int
+        maximum number of Newton iterations
+
+    Return:
+    -------
+    array of shape (n_sets, 2) with base and peak
+    (and array of shape (n_sets,) with the negative log likelihood)
+    """
+    phases = pad_ragged(data, offsets)
+    n_sets = phases.shape[0]
+    eccentricity = np.broadcast_to(np.asarray(eccentricity, dtype=float), (n_sets,))
+    n_orbits = np.broadcast_to(np.asarray(n_orbits, dtype=float), (n_sets,))
+    if ((eccentricity > 1) | (eccentricity < 0)).any():
+        raise KeyError('The eccentricity has to be between 0 and 1.')
+    shape = shape_function(model, major_axis_a)
+    if major_axis_a is not None:
+        major_axis_a = np.broadcast_to(np.asarray(major_axis_a, dtype=float), (n_sets,))
+        orbits = list(zip(eccentricity, major_axis_a))
+        shape_at_events = shape(phases, eccentricity[:, None], major_axis_a[:, None])
+    else:
+        orbits = [(e, None) for e in eccentricity]
+        shape_at_events = shape(phases, eccentricity[:, None])
+
+    weights = np.isfinite(phases).astype(float)
+    shape_at_events = np.where(weights > 0, shape_at_events, 0.)
+    integrals = np.array([shape_integral(shape, e, a) for e, a in orbits])
+    compensator = np.stack([n_orbits, n_orbits * integrals], axis=1)
+
+    theta, value = fit_newton(shape_at_events, weights, compensator, tol=tol, maxiter=maxiter)
+    if return_likelihood:
+        return theta, value
+    return theta
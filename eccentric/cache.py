@@ -0,0 +1,155 @@
+# Python 3.5
+# On-disk cache of fit results, keyed by a hash of data and model.
+
+import glob
+import hashlib
+import os
+import tempfile
+import numpy as np
+
+from . import __version__
+from .likelihood import is_chunk_list
+
+# Modules that fit results depend on. Their source is hashed into
+# every key, so that a change to the likelihood or the fitters
+# invalidates cached results without a bump of __version__.
+# Add a module here when fits start to depend on it.
+FIT_MODULES = ("models.py", "likelihood.py", "exposure.py", "spimodel.py")
+
+
+def code_version():
+    """Hash of the library version and the source of FIT_MODULES.
+    Falls back to the version alone where the source is not
+    available, e.g. in a frozen application.
+    """
+    digest = hashlib.sha256(__version__.encode())
+    for name in FIT_MODULES:
+        try:
+            with open(os.path.join(os.path.dirname(__file__), name), "rb") as file:
+                digest.update(file.read())
+        except OSError:
+            pass
+    return digest.hexdigest()
+
+
+CODE_VERSION = code_version()
+
+
+def fit_key(data, chunk_size=1 << 20, **parameters):
+    """Content hash of event phases, fit parameters,
+    and the code of the fits, see CODE_VERSION.
+
+    Parameters:
+    -----------
+    data : array, memmap, or list of arrays
+        event phases, hashed chunk by chunk
+    chunk_size : int
+        maximum number of events hashed at once
+    parameters : dict
+        model name, orbit, n_orbits, and anything
+        else the fit result depends on
+
+    Return:
+    -------
+    str, hexadecimal SHA-256 digest
+    """
+    digest = hashlib.sha256(CODE_VERSION.encode())
+    parts = data if is_chunk_list(data) else [data]
+    for part in parts:
+        for i in range(0, len(part), chunk_size):
+            digest.update(np.ascontiguousarray(part[i:i + chunk_size], dtype=float).tobytes())
+    for name, value in sorted(parameters.items()):
+        if isinstance(value, np.ndarray):
+            value = value.astype(float).tobytes()
+        elif isinstance(value, np.generic):
+            value = value.item()
+        digest.update(name.encode() + b"=" + (value if isinstance(value, bytes) else repr(value).encode()))
+    return digest.hexdigest()
+
+
+class FitCache(object):
+    """Content-addressed cache of fit results on disk, one
+    .npy file per key. Writes go to a temporary file that
+    is renamed into place, so that workers of a process pool
+    can share one cache directory. Reading an entry marks it
+    as recently used. Eviction runs in batches: every
+    max_entries // 10 writes of a process to a directory, the
+    directory is scanned once, and if it holds more than
+    max_entries results, the least recently used are removed
+    down to max_entries minus that batch size. The directory
+    may therefore briefly hold more than max_entries results.
+
+    Attributes:
+    ------------
+    path : str
+        cache directory
+    max_entries : int
+        maximum number of cached results
+    """
+    # writes since the last scan, per directory and process
+    _writes = {}
+
+    def __init__(self, path=".eccentric_cache", max_entries=100000):
+        self.path = str(path)
+        self.max_entries = max_entries
+        self.batch = max(1, max_entries // 10)
+        os.makedirs(self.path, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries())
+
+    def _file(self, key):
+        return os.path.join(self.path, key + ".npy")
+
+    def _entries(self):
+        return glob.glob(os.path.join(self.path, "*.npy"))
+
+    def get(self, key):
+        """Cached result as an array, or None."""
+        file = self._file(key)
+        try:
+            result = np.load(file)
+            os.utime(file)
+        except (OSError, ValueError):
+            return None
+        return result
+
+    def put(self, key, result):
+        """Store a result atomically and evict old entries."""
+        descriptor, temporary = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as file:
+                np.save(file, np.asarray(result, dtype=float))
+            os.replace(temporary, self._file(key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+        directory = os.path.abspath(self.path)
+        FitCache._writes[directory] = FitCache._writes.get(directory, 0) + 1
+        if FitCache._writes[directory] >= self.batch:
+            FitCache._writes[directory] = 0
+            self._evict()
+
+    def _evict(self):
+        entries = self._entries()
+        if len(entries) <= self.max_entries:
+            return
+        def last_used(file):
+            try:
+                return os.path.getmtime(file)
+            except OSError:
+                return np.inf
+        for file in sorted(entries, key=last_used)[:len(entries) - self.max_entries + self.batch]:
+            try:
+                os.remove(file)
+            except OSError:
+                # removed by another worker
+                pass
+
+    def clear(self):
+        """Remove all cached results."""
+        for file in self._entries():
+            try:
+                os.remove(file)
+            except OSError:
+                pass
@@ -0,0 +1,183 @@
+# Python 3.5
+# Store many synthetic flare realizations in one append-only file.
+
+import os
+import numpy as np
+import pandas as pd
+
+from .synthetic import SOURCES, PARAMETER_DTYPE, synthetic_flares_from_record
+
+FLARE_DTYPE = np.dtype([("peak_time", float), ("stacked_peak_time", float), ("source", np.int8)])
+
+INDEX_DTYPE = np.dtype([("realization", np.int64), ("offset", np.int64), ("count", np.int64)] +
+                       PARAMETER_DTYPE.descr)
+
+
+def index_path(path):
+    """Path of the index that belongs to a campaign file."""
+    return str(path) + ".index"
+
+
+def shard_path(path, shard):
+    """Path of the campaign file written by one worker."""
+    return "{}.shard{:04d}".format(path, shard)
+
+
+def flare_records(sf):
+    """Flare table of a SyntheticFlares object as records."""
+    flares = sf.all_flares
+    records = np.empty(flares.shape[0], dtype=FLARE_DTYPE)
+    records["peak_time"] = flares.peak_time.values
+    records["stacked_peak_time"] = (flares.stacked_peak_time.values
+                                    if "stacked_peak_time" in flares.columns else np.nan)
+    records["source"] = pd.Categorical(flares.source.values, categories=SOURCES).codes
+    return records
+
+
+class CampaignWriter(object):
+    """Append synthetic flare realizations to one campaign file.
+    Flares of all realizations go into a single binary file,
+    and an index file holds one record per realization with its
+    offset, number of flares, and parameters.
+    Use one writer per process, e.g. the parent of a process pool,
+    or one shard per worker with :func:`merge_shards`.
+
+    Parameters:
+    -----------
+    path : str
+        Path to the campaign file
+    mode : str
+        "w" starts a new campaign, "a" appends to an existing one
+    """
+    def __init__(self, path, mode="a"):
+        if mode not in ["w", "a"]:
+            raise ValueError("Mode must be 'w' or 'a'.")
+        self.path = str(path)
+        self._data = open(self.path, mode + "b")
+        self._index = open(index_path(self.path), mode + "b")
+        self._data.seek(0, os.SEEK_END)
+        self._index.seek(0, os.SEEK_END)
+        self.n_flares = self._data.tell() // FLARE_DTYPE.itemsize
+        self.n_realizations = self._index.tell() // INDEX_DTYPE.itemsize
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, sf, realization=None):
+        """Append the flare table and parameters of a SyntheticFlares object.
+
+        Parameters:
+        -----------
+        sf : SyntheticFlares
+            realization with all_flares
+        realization : int or None
+            id of the realization, defaults to its position
+        """
+        self.append_records(flare_records(sf), sf.parameter_record(), realization)
+
+    def append_records(self, records, parameters, realization=None):
+        """Append flare records and a parameter record,
+        e.g. as sent back from a worker process.
+
+        Parameters:
+        -----------
+        records : structured array
+            flares, see FLARE_DTYPE
+        parameters : structured array
+            one record, see :func:`SyntheticFlares.parameter_record`
+        realization : int or None
+            id of the realization, defaults to its position
+        """
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        for name in PARAMETER_DTYPE.names:
+            entry[name] = parameters[name]
+        entry["realization"] = self.n_realizations if realization is None else realization
+        entry["offset"], entry["count"] = self.n_flares, records.shape[0]
+        self._data.write(np.ascontiguousarray(records, dtype=FLARE_DTYPE).tobytes())
+        self._index.write(entry.tobytes())
+        self.n_flares += records.shape[0]
+        self.n_realizations += 1
+
+    def flush(self):
+        """Write buffered realizations to disk."""
+        self._data.flush()
+        self._index.flush()
+
+    def close(self):
+        self._data.close()
+        self._index.close()
+
+
+class CampaignReader(object):
+    """Memory-mapped access to a campaign file.
+    Realizations can be accessed by position,
+    or iterated over without loading the file.
+
+    Attributes:
+    ------------
+    index : structured array
+        one record per realization, see INDEX_DTYPE
+    flares : memmap
+        flare records of all realizations, see FLARE_DTYPE
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        self.index = np.fromfile(index_path(self.path), dtype=INDEX_DTYPE)
+        if os.path.getsize(self.path) == 0:
+            self.flares = np.empty(0, dtype=FLARE_DTYPE)
+        else:
+            self.flares = np.memmap(self.path, dtype=FLARE_DTYPE, mode="r")
+
+    def __len__(self):
+        return self.index.shape[0]
+
+    def __getitem__(self, k):
+        """Flare records of the realization at position k."""
+        entry = self.index[k]
+        return self.flares[entry["offset"]:entry["offset"] + entry["count"]]
+
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self.index[k], self[k]
+
+    def synthetic_flares(self, k, lazy=True):
+        """Restore the realization at position k as a SyntheticFlares object."""
+        records = self[k]
+        all_flares = pd.DataFrame({"source": np.asarray(SOURCES, dtype=object)[records["source"]],
+                                   "peak_time": records["peak_time"],
+                                   "stacked_peak_time": records["stacked_peak_time"]})
+        return synthetic_flares_from_record(self.index[k], all_flares, lazy=lazy)
+
+
+def merge_shards(path, shards, remove=True):
+    """Merge campaign shards of several workers into one campaign file.
+
+    Parameters:
+    -----------
+    path : str
+        Path to the merged campaign file, appended to if it exists
+    shards : list of str
+        Paths to the shard campaign files
+    remove : bool
+        If True, delete the shards after merging.
+    """
+    with CampaignWriter(path, mode="a") as writer:
+        for shard in shards:
+            index = np.fromfile(index_path(shard), dtype=INDEX_DTYPE)
+            index["offset"] += writer.n_flares
+            with open(shard, "rb") as data:
+                while True:
+                    chunk = data.read(1 << 24)
+                    if not chunk:
+                        break
+                    writer._data.write(chunk)
+            writer._index.write(index.tobytes())
+            writer.n_flares += index["count"].sum()
+            writer.n_realizations += index.shape[0]
+    if remove:
+        for shard in shards:
+            os.remove(shard)
+            os.remove(index_path(shard))
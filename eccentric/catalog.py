@@ -0,0 +1,191 @@
+# Python 3.5
+# Flare tables of many stars in one catalog.
+
+import glob
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from .batch import fit_batch
+
+FILENAME_PATTERN = re.compile(r"(?:\d{4}_\d{2}_\d{2}_)?(.+?)_flares?_full_sample\.csv$")
+
+# columns that identify the light curve of a flare
+LIGHTCURVE_COLUMNS = ("lightcurve", "quarter")
+
+# Kepler short cadence, in days
+KEPLER_SHORT_CADENCE = 58.85 / 86400.
+
+
+def star_from_filename(path):
+    """Star id from a flare table file name,
+    e.g. 2019_11_05_KOI12_flares_full_sample.csv -> KOI12
+    """
+    match = FILENAME_PATTERN.match(os.path.basename(path))
+    if match is None:
+        raise ValueError("Cannot read the star from {}.".format(path))
+    return match.group(1)
+
+
+def observing_time(flares, cadence=KEPLER_SHORT_CADENCE):
+    """Observed time per star from the number of valid data
+    points of each light curve. All flares of a light curve
+    carry its total_n_valid_data_points, so each light curve
+    is counted once per star.
+
+    Light curves are told apart by a "lightcurve" or "quarter"
+    column if the table has one. Otherwise each distinct value
+    of total_n_valid_data_points is taken as one light curve,
+    so two light curves of a star with equal counts are merged
+    into one. In both cases, light curves without any flare
+    are not in the table and are missing from the observed time.
+
+    Parameters:
+    -----------
+    flares : DataFrame
+        flares with star and total_n_valid_data_points columns,
+        and optionally a lightcurve or quarter column
+    cadence : float
+        time per data point, in the time units of tstart
+
+    Return:
+    -------
+    Series indexed by star
+    """
+    valid = flares.dropna(subset=["total_n_valid_data_points"])
+    key = next((column for column in LIGHTCURVE_COLUMNS if column in valid.columns),
+               "total_n_valid_data_points")
+    valid = valid.drop_duplicates(["star", key])
+    return valid.groupby("star").total_n_valid_data_points.sum() * cadence
+
+
+def read_catalog(path="data", systems=None, min_c=-.5, cadence=KEPLER_SHORT_CADENCE):
+    """Read all flare tables in a directory into one catalog.
+
+    Parameters:
+    -----------
+    path : str or list of str
+        directory with *_flares_full_sample.csv files,
+        or a list of such files
+    systems : DataFrame or None
+        orbital parameters per star, see :class:`FlareCatalog`
+    min_c : float or None
+        keep only flares with c > min_c,
+        None keeps all flares
+    cadence : float
+        time per data point, see :func:`observing_time`
+
+    Return:
+    -------
+    FlareCatalog
+    """
+    if isinstance(path, str):
+        paths = sorted(glob.glob(os.path.join(path, "*_flare*_full_sample.csv")))
+    else:
+        paths = list(path)
+    tables = [pd.read_csv(p).assign(star=star_from_filename(p)) for p in paths]
+    flares = pd.concat(tables, ignore_index=True)
+    # count the light curves before flares are dropped
+    time = observing_time(flares, cadence) if "total_n_valid_data_points" in flares.columns else None
+    if min_c is not None:
+        flares = flares[flares.c > min_c]
+    return FlareCatalog(flares, systems=systems, observed_time=time)
+
+
+class FlareCatalog(object):
+    """Flares of many stars in one columnar table.
+
+    Attributes:
+    ------------
+    flares : DataFrame
+        one row per flare with a star column, sorted by
+        star and tstart, so that each star is a contiguous block
+    stars : array
+        star ids in the order of the blocks
+    offsets : array
+        flares of star k are flares.iloc[offsets[k]:offsets[k+1]]
+    systems : DataFrame
+        indexed by star, with columns period [d], eccentricity,
+        and periastron [same time as tstart], optionally
+        major_axis_a and n_orbits
+    observed_time : Series or None
+        observed time per star, by default from the valid
+        data points of the flare tables, see :func:`observing_time`
+    """
+    def __init__(self, flares, systems=None, observed_time=None, cadence=KEPLER_SHORT_CADENCE):
+        self.flares = flares.sort_values(["star", "tstart"], kind="stable").reset_index(drop=True)
+        self.stars, counts = np.unique(self.flares.star.values.astype(str), return_counts=True)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        if systems is None:
+            systems = pd.DataFrame(columns=["period", "eccentricity", "periastron"],
+                                   index=pd.Index([], name="star"), dtype=float)
+        self.systems = systems
+        if observed_time is None and "total_n_valid_data_points" in self.flares.columns:
+            observed_time = observing_time(self.flares, cadence)
+        self.observed_time = observed_time
+
+    def __repr__(self):
+        return("Flare catalog, {} flares on {} stars".format(self.flares.shape[0], len(self.stars)))
+
+    def star(self, star):
+        """Flare table of a single star."""
+        k = np.searchsorted(self.stars, star)
+        if k == len(self.stars) or self.stars[k] != star:
+            raise KeyError("Star {} is not in the catalog.".format(star))
+        return self.flares.iloc[self.offsets[k]:self.offsets[k + 1]]
+
+    def _per_flare(self, column):
+        """Broadcast a systems column to all flares."""
+        per_star = self.systems[column].reindex(self.stars).values.astype(float)
+        return np.repeat(per_star, np.diff(self.offsets))
+
+    def fold(self, time="tstart"):
+        """Fold all flares with their orbital period in one go.
+        Phases follow the models: 0.5 is the periastron.
+        Stars without orbital parameters get NaN.
+
+        Return:
+        -------
+        array of stacked phases between 0 and 1, in the order of flares
+        """
+        period, periastron = self._per_flare("period"), self._per_flare("periastron")
+        return ((self.flares[time].values - periastron) / period + 0.5) % 1.
+
+    def n_orbits(self):
+        """Number of orbits per star. Taken from the systems
+        table if given, or else the observed time divided by
+        the period. Stars without a period get NaN.
+        """
+        period = self.systems.period.reindex(self.stars).values.astype(float)
+        n_orbits = np.full(len(self.stars), np.nan)
+        if "n_orbits" in self.systems.columns:
+            n_orbits = self.systems.n_orbits.reindex(self.stars).values.astype(float)
+        if self.observed_time is not None:
+            estimate = self.observed_time.reindex(self.stars).values.astype(float) / period
+            n_orbits = np.where(np.isfinite(n_orbits), n_orbits, estimate)
+        missing = np.isfinite(period) & ~np.isfinite(n_orbits)
+        if missing.any():
+            raise ValueError("No n_orbits and no valid data points for {}.".format(", ".join(self.stars[missing])))
+        return n_orbits
+
+    def fit(self, model="absolute_distance_influence", use_major_axis=False):
+        """Fit base and peak for all stars with
+        orbital parameters in one vectorized call,
+        see :func:`batch.fit_batch`.
+
+        Return:
+        -------
+        DataFrame indexed by star with base, peak, and n_flares
+        """
+        known = np.isin(self.stars, self.systems.dropna(subset=["period", "eccentricity", "periastron"]).index)
+        phases, counts = self.fold(), np.diff(self.offsets)
+        keep = np.repeat(known, counts)
+        offsets = np.concatenate([[0], np.cumsum(counts[known])])
+        eccentricity = self.systems.eccentricity.reindex(self.stars[known]).values.astype(float)
+        major_axis_a = (self.systems.major_axis_a.reindex(self.stars[known]).values.astype(float)
+                        if use_major_axis else None)
+        params = fit_batch(phases[keep], eccentricity, self.n_orbits()[known], offsets=offsets,
+                           major_axis_a=major_axis_a, model=model)
+        return pd.DataFrame({"base": params[:, 0], "peak": params[:, 1], "n_flares": counts[known]},
+                            index=pd.Index(self.stars[known], name="star"))
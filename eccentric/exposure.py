@@ -0,0 +1,99 @@
+# Python 3.5
+# Exposure of gappy observations over the orbital phase.
+
+import numpy as np
+from .models import shape_bin_integrals
+
+
+def _phase(time, period, periastron):
+    """Unwrapped orbital phase in orbits, 0.5 at the periastron."""
+    return (np.asarray(time, dtype=float) - periastron) / period + 0.5
+
+
+def exposure_from_intervals(intervals, period, periastron, n_bins=100):
+    """Exposure per phase bin from good-time intervals.
+
+    Parameters:
+    -----------
+    intervals : array (n_intervals, 2)
+        start and stop times of the observations
+    period : float
+        orbital period, in the same units as the intervals
+    periastron : float
+        time of a periastron passage
+    n_bins : int
+        number of equal phase bins between 0 and 1
+
+    Return:
+    -------
+    array (n_bins,) of observed time per phase bin in orbits,
+    the sum is the number of orbits observed
+    """
+    intervals = np.asarray(intervals, dtype=float).reshape(-1, 2)
+    width = 1. / n_bins
+    lower = np.arange(n_bins) * width
+
+    def covered(phase):
+        # time spent in each bin from phase 0 up to phase
+        cycles = np.floor(phase)[:, np.newaxis]
+        return cycles * width + np.clip(phase[:, np.newaxis] - cycles - lower, 0, width)
+
+    start = _phase(intervals[:, 0], period, periastron)
+    stop = _phase(intervals[:, 1], period, periastron)
+    return (covered(stop) - covered(start)).sum(axis=0)
+
+
+def exposure_from_cadence(times, period, periastron, exposure_time, valid=None, n_bins=100):
+    """Exposure per phase bin from a time series with a mask
+    of valid data points, e.g. a light curve with gaps.
+
+    Parameters:
+    -----------
+    times : array
+        times of the data points
+    period : float
+        orbital period, in the same units as times
+    periastron : float
+        time of a periastron passage
+    exposure_time : float
+        time covered by each data point
+    valid : boolean array or None
+        mask of valid data points, None counts all
+    n_bins : int
+        number of equal phase bins between 0 and 1
+
+    Return:
+    -------
+    array (n_bins,) of observed time per phase bin in orbits
+    """
+    phase = _phase(times, period, periastron) % 1.
+    bins = np.minimum((phase * n_bins).astype(int), n_bins - 1)
+    weights = np.full(bins.shape, exposure_time / period)
+    if valid is not None:
+        weights = weights * np.asarray(valid, dtype=bool)
+    return np.bincount(bins, weights=weights, minlength=n_bins)
+
+
+def exposure_compensator(shape, eccentricity, exposure, major_axis_a=None):
+    """Integral of the intensity over the observations per unit
+    base and per unit peak, from an exposure histogram. The shape
+    integrals per bin are cached, so that fits on gappy data
+    reduce to one dot product per orbit.
+
+    Parameters:
+    -----------
+    shape : function
+        shape term of the intensity model
+    eccentricity, major_axis_a : float
+        orbit of the model
+    exposure : array (n_bins,)
+        observed time per phase bin in orbits
+
+    Return:
+    -------
+    array (2,)
+    """
+    exposure = np.asarray(exposure, dtype=float)
+    n_bins = exposure.shape[0]
+    integrals = shape_bin_integrals(shape, eccentricity, major_axis_a, n_bins)
+    return np.array([exposure.sum(), n_bins * exposure.dot(integrals)])
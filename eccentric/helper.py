@@ -1,12 +1,88 @@
 import numpy as np
-import math
 
-def find_nearest(array, value):
+def find_nearest(array, value, return_index=False):
     """Find the nearest value to the
-    entries in a given array."""
+    entries in a given array.
+
+    Parameters:
+    -----------
+    array : array
+        sorted array to search in
+    value : float or array
+        one or many values to find the nearest entries for,
+        ties go to the larger entry
+    return_index : bool
+        If True, also return the indices of the
+        nearest entries in array.
+    """
+    array = np.asarray(array)
     idx = np.searchsorted(array, value, side="left")
- #   condition = 
-    if idx > 0 and (idx == len(array) or math.fabs(value - array[idx-1]) < math.fabs(value - array[idx])):
-        return array[idx-1]
+    lower = np.clip(idx - 1, 0, len(array) - 1)
+    upper = np.clip(idx, 0, len(array) - 1)
+    take_lower = (idx > 0) & ((idx == len(array)) |
+                              (np.abs(value - array[lower]) < np.abs(value - array[upper])))
+    nearest = np.where(take_lower, lower, upper)
+    if return_index:
+        return array[nearest], nearest
+    return array[nearest]
+
+
+def find_nearest_on_grid(grid, value, return_index=False):
+    """Find the nearest value to the entries in an
+    evenly spaced grid without materializing it.
+    Ties go to the larger entry as in :func:`find_nearest`.
+
+    Parameters:
+    -----------
+    grid : tuple
+        (start, step, n) of the grid start + i * step, i < n
+    value : float or array
+        one or many values to find the nearest entries for
+    return_index : bool
+        If True, also return the indices of the
+        nearest entries in the grid.
+    """
+    start, step, n = grid
+    if step > 0:
+        idx = np.clip(np.floor((np.asarray(value) - start) / step + 0.5), 0, n - 1).astype(np.int64)
     else:
-        return array[idx]
\ No newline at end of file
+        idx = np.zeros(np.shape(value), dtype=np.int64)
+    if return_index:
+        return start + idx * step, idx
+    return start + idx * step
+
+
+def sample_without_replacement(rng, n, k):
+    """Draw k distinct integers from 0 to n-1
+    in O(k) memory, returned sorted.
+
+    Parameters:
+    -----------
+    rng : Generator or numpy.random
+        random number generator, see :func:`random_generator`
+    n : int
+        size of the population
+    k : int
+        sample size, at most n
+    """
+    idx = np.array([], dtype=np.int64)
+    while idx.shape[0] < k:
+        draws = np.floor(rng.random(k - idx.shape[0]) * n).astype(np.int64)
+        idx = np.unique(np.concatenate([idx, draws]))
+    return idx
+
+
+def random_generator(seed=None):
+    """Get a random number generator.
+
+    Parameters:
+    -----------
+    seed : None, int, SeedSequence, or Generator
+        None uses the global numpy random state,
+        anything else is passed to np.random.default_rng,
+        so that a Generator is used as is and
+        SeedSequences can be spawned for parallel workers.
+    """
+    if seed is None:
+        return np.random
+    return np.random.default_rng(seed)
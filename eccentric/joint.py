@@ -0,0 +1,115 @@
+# Python 3.5
+# Joint fit of many stars with shared SPI parameters.
+
+import numpy as np
+from scipy.optimize import minimize
+
+from .likelihood import negative_log_likelihood, ChunkedModel
+
+
+class JointSPI_Model(object):
+    """Joint likelihood of many stars, each with its own
+    base rate, orbit, and number of orbits, and a shared
+    SPI parameter. The per-star likelihoods are summed over
+    the cached shape terms of the compiled per-star models,
+    all stars at once.
+
+    Attributes:
+    ------------
+    models : list of SPI_Model
+        one model per star with data, orbit, and n_orbits
+    shared : str
+        "peak": all stars share the same peak,
+        "ratio": all stars share the ratio peak / base
+    MLE_params : tuple
+        base per star and the shared parameter
+    """
+    def __init__(self, models, shared="peak"):
+        if shared not in ["peak", "ratio"]:
+            raise KeyError('Shared parameter must be "peak" or "ratio".')
+        self.models = models
+        self.shared = shared
+        self.MLE_params = None
+        self._stack()
+
+    def _stack(self):
+        """Pad the cached shape terms of all stars into one array."""
+        compiled = [model.compile() for model in self.models]
+        if any(isinstance(c, ChunkedModel) for c in compiled):
+            raise TypeError('Joint fits need the shape terms in memory, chunked data is not supported.')
+        length = max([c.shape.shape[0] for c in compiled] + [0])
+        self._shape = np.zeros((len(compiled), length))
+        self._weights = np.zeros((len(compiled), length))
+        for k, c in enumerate(compiled):
+            self._shape[k, :c.shape.shape[0]] = c.shape
+            self._weights[k, :c.shape.shape[0]] = c.weights
+        self._compensator = np.array([c.compensator for c in compiled])
+
+    def _theta(self, parameters):
+        """Base and peak per star."""
+        bases, shared = np.asarray(parameters[:-1], dtype=float), parameters[-1]
+        peaks = np.full_like(bases, shared) if self.shared == "peak" else shared * bases
+        return np.stack([bases, peaks], axis=1)
+
+    def _negative_likelihood_function(self, parameters):
+        '''
+        Joint negative log likelihood and its gradient
+        with respect to the bases and the shared parameter.
+        '''
+        if np.isnan(parameters).any():
+            raise ValueError('Negative likelihood function received at least one nan-value.')
+        theta = self._theta(parameters)
+        value, g, _ = negative_log_likelihood(theta, self._shape, self._weights,
+                                              self._compensator, derivatives=True)
+        gradient = np.empty(len(parameters))
+        if self.shared == "peak":
+            gradient[:-1], gradient[-1] = g[:, 0], g[:, 1].sum()
+        else:
+            gradient[:-1], gradient[-1] = g[:, 0] + parameters[-1] * g[:, 1], (theta[:, 0] * g[:, 1]).sum()
+        return value.sum(), gradient
+
+    def _negative_likelihood_hessian(self, parameters):
+        '''
+        Hessian of the joint negative log likelihood.
+        '''
+        theta = self._theta(parameters)
+        _, g, h = negative_log_likelihood(theta, self._shape, self._weights,
+                                          self._compensator, derivatives=True)
+        n, shared = len(parameters), parameters[-1]
+        hessian = np.zeros((n, n))
+        index = np.arange(n - 1)
+        if self.shared == "peak":
+            hessian[index, index] = h[:, 0, 0]
+            hessian[index, -1] = hessian[-1, index] = h[:, 0, 1]
+            hessian[-1, -1] = h[:, 1, 1].sum()
+        else:
+            bases = theta[:, 0]
+            hessian[index, index] = h[:, 0, 0] + 2 * shared * h[:, 0, 1] + shared**2 * h[:, 1, 1]
+            hessian[index, -1] = hessian[-1, index] = bases * (h[:, 0, 1] + shared * h[:, 1, 1]) + g[:, 1]
+            hessian[-1, -1] = (bases**2 * h[:, 1, 1]).sum()
+        return hessian
+
+    def estimate_parameters(self):
+        '''
+        Maximum likelihood estimates of the base per star
+        and the shared parameter.
+        '''
+        if self._weights.sum() == 0:
+            raise ValueError('No input data given.')
+        start = np.append(self._weights.sum(axis=1) / self._compensator[:, 0], 0.)
+        result = minimize(self._negative_likelihood_function, start, jac=True,
+                          bounds=[(0, None)] * len(start))
+        self.MLE_params = result['x'][:-1], result['x'][-1]
+        return self.MLE_params
+
+    def standard_errors(self):
+        '''
+        Standard errors of the bases and the shared parameter
+        from the inverse Hessian at the maximum likelihood estimate.
+        '''
+        if self.MLE_params is None:
+            self.estimate_parameters()
+        parameters = np.append(*self.MLE_params)
+        covariance = np.linalg.inv(self._negative_likelihood_hessian(parameters))
+        errors = np.sqrt(np.diag(covariance))
+        return errors[:-1], errors[-1]
@@ -0,0 +1,388 @@
+# Python 3.5
+# Likelihood of the linear intensity models base + peak * shape.
+
+import numpy as np
+from .models import shape_integral, shape_bin_integrals, check_finite
+from .exposure import exposure_compensator
+
+
+def negative_log_likelihood(theta, shape, weights, compensator, derivatives=False):
+    """Negative log likelihood of base + peak * shape
+    for each data set, and optionally its gradient and Hessian.
+
+    Parameters:
+    -----------
+    theta : array (n_sets, 2)
+        base and peak
+    shape : array (n_sets, n_events)
+        shape term at the events, 0 where padded
+    weights : array (n_sets, n_events)
+        number of events per entry, 0 where padded
+    compensator : array (n_sets, 2)
+        integral of the intensity over all orbits
+        per unit base and per unit peak
+    """
+    events = weights > 0
+    intensity = np.where(events, theta[:, :1] + theta[:, 1:] * shape, 1.)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        log_intensity = np.where(events, np.log(intensity), 0.)
+        value = -(weights * log_intensity).sum(axis=1) + (compensator * theta).sum(axis=1)
+        value[~np.isfinite(value)] = np.inf
+        if not derivatives:
+            return value
+        inverse = weights / intensity
+        gradient = np.stack([-inverse.sum(axis=1), -(inverse * shape).sum(axis=1)], axis=1) + compensator
+        inverse = inverse / intensity
+        hessian = np.empty((len(theta), 2, 2))
+        hessian[:, 0, 0] = inverse.sum(axis=1)
+        hessian[:, 0, 1] = hessian[:, 1, 0] = (inverse * shape).sum(axis=1)
+        hessian[:, 1, 1] = (inverse * shape**2).sum(axis=1)
+    return value, gradient, hessian
+
+
+def fit_newton(shape, weights, compensator, theta=None, tol=1e-10, maxiter=100):
+    """Minimize the negative log likelihood for all
+    data sets simultaneously with a projected Newton method
+    on base >= 0, peak >= 0 and a backtracking line search.
+    The problem is convex, so this converges to the global
+    minimum for every data set.
+
+    Return:
+    -------
+    theta : array (n_sets, 2)
+    value : array (n_sets,)
+    """
+    if theta is None:
+        # start with a purely homogeneous process
+        theta = np.zeros((shape.shape[0], 2))
+        theta[:, 0] = weights.sum(axis=1) / compensator[:, 0]
+    theta = np.array(theta, dtype=float)
+    value = negative_log_likelihood(theta, shape, weights, compensator)
+    todo = np.ones(len(theta), dtype=bool)
+
+    for _ in range(maxiter):
+        index = np.flatnonzero(todo)
+        if len(index) == 0:
+            break
+        t, s, w, c = theta[index], shape[index], weights[index], compensator[index]
+        f, g, h = negative_log_likelihood(t, s, w, c, derivatives=True)
+
+        # parameters sitting on their bound and pushed against it stay fixed
+        active = (t <= 0) & (g >= 0)
+        direction = np.zeros_like(t)
+        determinant = h[:, 0, 0] * h[:, 1, 1] - h[:, 0, 1]**2
+        both = ~active[:, 0] & ~active[:, 1] & (determinant > 0)
+        direction[both, 0] = -(h[both, 1, 1] * g[both, 0] - h[both, 0, 1] * g[both, 1]) / determinant[both]
+        direction[both, 1] = -(h[both, 0, 0] * g[both, 1] - h[both, 0, 1] * g[both, 0]) / determinant[both]
+        for i in range(2):
+            single = ~active[:, i] & ~both & (h[:, i, i] > 0)
+            direction[single, i] = -g[single, i] / h[single, i, i]
+
+        # backtrack along the projected Newton direction
+        step = np.ones(len(t))
+        accepted = np.zeros(len(t), dtype=bool)
+        new_t, new_f = t.copy(), f.copy()
+        for _ in range(60):
+            pending = np.flatnonzero(~accepted)
+            if len(pending) == 0:
+                break
+            trial = np.maximum(t[pending] + step[pending, None] * direction[pending], 0.)
+            trial_f = negative_log_likelihood(trial, s[pending], w[pending], c[pending])
+            decrease = (g[pending] * (trial - t[pending])).sum(axis=1)
+            ok = trial_f <= f[pending] + 1e-4 * np.minimum(decrease, 0.)
+            new_t[pending[ok]], new_f[pending[ok]] = trial[ok], trial_f[ok]
+            accepted[pending[ok]] = True
+            step[pending[~ok]] /= 2.
+
+        change = np.abs(new_t - t).max(axis=1)
+        theta[index], value[index] = new_t, new_f
+        todo[index] = accepted & (change > tol * (1. + np.abs(new_t).max(axis=1)))
+
+    return theta, value
+
+
+def orbit_compensator(shape, eccentricity, major_axis_a=None, n_orbits=1, exposure=None):
+    """Integral of the intensity over all observed orbits per unit
+    base and per unit peak, for n_orbits fully covered orbits,
+    or from an exposure histogram, see :mod:`exposure`.
+    """
+    if exposure is None:
+        return n_orbits * np.array([1., shape_integral(shape, eccentricity, major_axis_a)])
+    return exposure_compensator(shape, eccentricity, exposure, major_axis_a)
+
+
+class CompiledModel(object):
+    """Intensity model compiled for one data set and orbit.
+    The shape term at the events and its integral over one
+    orbit are computed once, so that each likelihood evaluation
+    reduces to base + peak * shape and a sum of logarithms.
+
+    Attributes:
+    ------------
+    shape : array
+        shape term at each event phase
+    weights : array
+        number of events per entry of shape
+    integral : float
+        integral of the shape term over one orbit
+    compensator : array
+        integral of the intensity over all orbits
+        per unit base and per unit peak
+    exposure : array or None
+        observed time per phase bin in orbits for partial
+        orbital coverage, see :mod:`exposure`, None assumes
+        n_orbits fully covered orbits
+    """
+    _buffer = None
+
+    def __init__(self, data, shape, eccentricity, major_axis_a=None, n_orbits=1, exposure=None):
+        self._set_orbit(shape, eccentricity, major_axis_a, n_orbits, exposure)
+        data = np.asarray(data, dtype=float)
+        self.shape = np.asarray(shape(data, eccentricity, major_axis_a), dtype=float)
+        check_finite(self.shape)
+        self.weights = np.ones_like(self.shape)
+
+    def _set_orbit(self, shape, eccentricity, major_axis_a, n_orbits, exposure=None):
+        check_finite([eccentricity] if major_axis_a is None else [eccentricity, major_axis_a])
+        if eccentricity > 1 or eccentricity < 0:
+            raise KeyError('The eccentricity has to be between 0 and 1.')
+        self.shape_function = shape
+        self.eccentricity = eccentricity
+        self.major_axis_a = major_axis_a
+        self.n_orbits = n_orbits
+        self.integral = shape_integral(shape, eccentricity, major_axis_a)
+        self.exposure = exposure
+        self.compensator = orbit_compensator(shape, eccentricity, major_axis_a, n_orbits, exposure)
+
+    def _add_orbits(self, n_orbits, exposure):
+        """Add fully covered orbits and an exposure histogram."""
+        if exposure is None and self.exposure is not None:
+            exposure = np.zeros_like(self.exposure)
+        if exposure is not None:
+            exposure = np.asarray(exposure, dtype=float)
+            previous = (self.exposure if self.exposure is not None
+                        else np.full(exposure.shape, self.n_orbits / exposure.shape[0]))
+            exposure = previous + exposure + n_orbits / exposure.shape[0]
+        self._set_orbit(self.shape_function, self.eccentricity, self.major_axis_a,
+                        self.n_orbits + n_orbits, exposure)
+
+    def append(self, data, n_orbits=0, exposure=None):
+        """Add new events, and new orbits or exposure, in O(new events).
+        The shape term is kept in a buffer that grows geometrically,
+        so that appending does not copy the events seen so far.
+
+        Parameters:
+        -----------
+        data : array
+            phases of the new events
+        n_orbits : float
+            number of fully covered orbits added
+        exposure : array or None
+            exposure added per phase bin, see :mod:`exposure`
+        """
+        shape = np.asarray(self.shape_function(np.asarray(data, dtype=float), self.eccentricity,
+                                               self.major_axis_a), dtype=float).ravel()
+        check_finite(shape)
+        n, total = self.shape.shape[0], self.shape.shape[0] + shape.shape[0]
+        if self._buffer is None or self.shape.base is not self._buffer or total > self._buffer.shape[1]:
+            buffer = np.empty((2, max(total, 2 * n, 1024)))
+            buffer[0, :n], buffer[1, :n] = self.shape, self.weights
+            self._buffer = buffer
+        self._buffer[0, n:total], self._buffer[1, n:total] = shape, 1.
+        self.shape, self.weights = self._buffer[0, :total], self._buffer[1, :total]
+        self._add_orbits(n_orbits, exposure)
+
+    def _theta(self, parameters):
+        base, peak = parameters
+        if not np.isfinite([base, peak]).all():
+            raise ValueError('Base and peak have to be finite.')
+        elif base < 0:
+            raise KeyError('The base rate has to be non-negative')
+        elif peak < 0:
+            raise KeyError('The peak has to have non-negative height.')
+        return np.array([[base, peak]], dtype=float)
+
+    def _evaluate(self, parameters, derivatives=False):
+        result = negative_log_likelihood(self._theta(parameters), self.shape[np.newaxis],
+                                         self.weights[np.newaxis], self.compensator[np.newaxis],
+                                         derivatives=derivatives)
+        if derivatives:
+            return tuple(r[0] for r in result)
+        return result[0]
+
+    def intensity(self, parameters):
+        """Intensity at the events."""
+        base, peak = self._theta(parameters)[0]
+        return base + peak * self.shape
+
+    def negative_log_likelihood(self, parameters):
+        """Negative log likelihood, inf where the
+        intensity vanishes at an event."""
+        return self._evaluate(parameters)
+
+    def gradient(self, parameters):
+        """Gradient of the negative log likelihood
+        with respect to base and peak."""
+        return self._evaluate(parameters, derivatives=True)[1]
+
+    def value_and_gradient(self, parameters):
+        """Negative log likelihood and its gradient
+        in a single pass over the data."""
+        value, gradient, _ = self._evaluate(parameters, derivatives=True)
+        return value, gradient
+
+    def hessian(self, parameters):
+        """Hessian of the negative log likelihood
+        with respect to base and peak."""
+        return self._evaluate(parameters, derivatives=True)[2]
+
+
+def is_chunk_list(data):
+    """True if data is a list or tuple of arrays, i.e. chunks
+    of events, and not a plain sequence of phases."""
+    return (isinstance(data, (list, tuple)) and len(data) > 0
+            and all(isinstance(part, np.ndarray) for part in data))
+
+
+class ChunkedModel(CompiledModel):
+    """Intensity model for event sets too large to keep
+    the shape term in memory, e.g. memory-mapped phases.
+    The likelihood is summed over chunks of at most chunk_size
+    events, so that memory stays bounded by the chunk size
+    regardless of the number of events. The shape term is
+    recomputed per chunk in every evaluation, so unlike
+    CompiledModel there are no shape and weights arrays.
+    Consumers that need them, e.g. joint fits, posterior
+    sampling, or the likelihood ratio test, raise a TypeError.
+
+    Attributes:
+    ------------
+    data : array, memmap, or list of arrays
+        event phases, a list holds the chunks of
+        a pooled data set, e.g. one per star
+    chunk_size : int
+        maximum number of events evaluated at once
+    n_events : int
+        total number of events
+    """
+    def __init__(self, data, shape, eccentricity, major_axis_a=None, n_orbits=1, chunk_size=1 << 20,
+                 exposure=None):
+        if iter(data) is data:
+            raise TypeError('Chunks must be re-iterable, e.g. a list of arrays, not an iterator.')
+        self._set_orbit(shape, eccentricity, major_axis_a, n_orbits, exposure)
+        self.data = data
+        self.chunk_size = int(chunk_size)
+        self.n_events = 0
+        for chunk in self.chunks():
+            check_finite(chunk)
+            self.n_events += len(chunk)
+
+    def _parts(self):
+        if is_chunk_list(self.data):
+            return self.data
+        return [self.data]
+
+    def chunks(self):
+        """Iterate over the event phases in chunks."""
+        for part in self._parts():
+            for i in range(0, len(part), self.chunk_size):
+                yield np.asarray(part[i:i + self.chunk_size], dtype=float)
+
+    def _evaluate(self, parameters, derivatives=False):
+        theta = self._theta(parameters)
+        no_compensator = np.zeros((1, 2))
+        value, gradient, hessian = 0., np.zeros(2), np.zeros((2, 2))
+        for chunk in self.chunks():
+            shape = np.asarray(self.shape_function(chunk, self.eccentricity, self.major_axis_a),
+                               dtype=float)[np.newaxis]
+            result = negative_log_likelihood(theta, shape, np.ones_like(shape), no_compensator,
+                                             derivatives=derivatives)
+            if derivatives:
+                value, gradient, hessian = value + result[0][0], gradient + result[1][0], hessian + result[2][0]
+            else:
+                value += result[0]
+        value += (self.compensator * theta[0]).sum()
+        if derivatives:
+            return value, gradient + self.compensator, hessian
+        return value
+
+    def append(self, data, n_orbits=0, exposure=None):
+        """Add new events as another chunk, and new orbits or exposure."""
+        data = np.asarray(data, dtype=float)
+        check_finite(data)
+        self.data = list(self._parts()) + [data]
+        self.n_events += data.shape[0]
+        self._add_orbits(n_orbits, exposure)
+
+    def intensity(self, parameters):
+        """Intensity at the events."""
+        base, peak = self._theta(parameters)[0]
+        return np.concatenate([base + peak * self.shape_function(chunk, self.eccentricity, self.major_axis_a)
+                               for chunk in self.chunks()] + [np.array([])])
+
+
+def bin_phases(data, n_bins, chunk_size=1 << 20):
+    """Histogram of event phases in n_bins equal bins between
+    0 and 1, computed chunk by chunk.
+
+    Parameters:
+    -----------
+    data : array, memmap, or list of arrays
+        event phases, phases are taken modulo 1,
+        NaN or infinite phases raise a ValueError
+    n_bins : int
+        number of phase bins
+    chunk_size : int
+        maximum number of events binned at once
+
+    Return:
+    -------
+    array (n_bins,) of event counts
+    """
+    parts = data if is_chunk_list(data) else [data]
+    counts = np.zeros(n_bins)
+    for part in parts:
+        for i in range(0, len(part), chunk_size):
+            phase = np.asarray(part[i:i + chunk_size], dtype=float)
+            check_finite(phase)
+            phase = phase % 1.
+            bins = np.minimum((phase * n_bins).astype(int), n_bins - 1)
+            counts += np.bincount(bins, minlength=n_bins)
+    return counts
+
+
+class BinnedModel(CompiledModel):
+    """Intensity model on event counts in phase bins.
+    The events are histogrammed once, and the shape term is
+    replaced by its mean over each bin, so that each likelihood
+    evaluation costs O(n_bins) instead of O(events). This is the
+    binned Poisson likelihood up to a constant, and approaches
+    the unbinned likelihood for narrow bins.
+
+    Attributes:
+    ------------
+    n_bins : int
+        number of phase bins
+    shape : array
+        mean shape term in each bin
+    weights : array
+        number of events in each bin
+    """
+    def __init__(self, data, shape, eccentricity, major_axis_a=None, n_orbits=1, n_bins=1000,
+                 chunk_size=1 << 20, exposure=None):
+        if iter(data) is data:
+            raise TypeError('Data must be re-iterable, e.g. a list of arrays, not an iterator.')
+        self._set_orbit(shape, eccentricity, major_axis_a, n_orbits, exposure)
+        self.n_bins = int(n_bins)
+        self.shape = self.n_bins * shape_bin_integrals(shape, eccentricity, major_axis_a, self.n_bins)
+        self.weights = bin_phases(data, self.n_bins, int(chunk_size))
+
+    def append(self, data, n_orbits=0, exposure=None):
+        """Add new events to the bin counts, and new orbits or exposure."""
+        self.weights = self.weights + bin_phases(data, self.n_bins)
+        self._add_orbits(n_orbits, exposure)
+
+    def intensity(self, parameters):
+        """Mean intensity in each bin."""
+        base, peak = self._theta(parameters)[0]
+        return base + peak * self.shape
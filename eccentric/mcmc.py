@@ -0,0 +1,208 @@
+# Python 3.5
+# Posterior sampling of base, peak, and eccentricity with an ensemble sampler.
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .models import shape_bin_integrals
+from .likelihood import negative_log_likelihood, orbit_compensator, is_chunk_list, ChunkedModel, BinnedModel
+
+
+class LogPosterior(object):
+    """Log posterior of base and peak, and optionally the
+    eccentricity, for a whole ensemble of walkers in one
+    vectorized call. Priors are flat on base >= 0, peak >= 0,
+    and 0 <= eccentricity <= 1.
+
+    With fixed eccentricity the cached shape term of the compiled
+    model is used. With the eccentricity sampled, the shape term
+    is evaluated for all walkers at once, and the compensator is
+    interpolated from a grid of eccentricities, so that no walker
+    needs a numerical integration. For binned data, the mean shape
+    term per bin is interpolated from the same grid.
+
+    Attributes:
+    ------------
+    sample_eccentricity : bool
+        If True, walkers are (base, peak, eccentricity),
+        else (base, peak).
+    eccentricity_grid : array
+        eccentricities at which the compensator is tabulated
+    """
+    def __init__(self, spi_model, sample_eccentricity=False, n_grid=101):
+        compiled = spi_model.compile()
+        if isinstance(compiled, ChunkedModel):
+            raise TypeError('Posterior sampling needs the shape terms in memory, chunked data is not supported.')
+        self.sample_eccentricity = sample_eccentricity
+        self.weights = compiled.weights
+        if not sample_eccentricity:
+            self.shape = compiled.shape
+            self.compensator = compiled.compensator
+            return
+        self.shape_function = spi_model.shape_function()
+        self.major_axis_a = spi_model.major_axis_a
+        self.eccentricity_grid = np.linspace(0, 1, n_grid)
+        self.compensator_grid = np.array([orbit_compensator(self.shape_function, e, self.major_axis_a,
+                                                            spi_model.n_orbits, spi_model.exposure)
+                                          for e in self.eccentricity_grid])
+        keep = self.weights > 0
+        self.weights = self.weights[keep]
+        if isinstance(compiled, BinnedModel):
+            # mean shape term of each bin with events, as in BinnedModel
+            self.phases = None
+            self.shape_grid = np.array([compiled.n_bins * shape_bin_integrals(self.shape_function, e, self.major_axis_a,
+                                                                              compiled.n_bins)[keep]
+                                        for e in self.eccentricity_grid])
+            return
+        if is_chunk_list(spi_model.data):
+            phases = np.concatenate([np.asarray(part, dtype=float) for part in spi_model.data])
+        else:
+            phases = np.asarray(spi_model.data, dtype=float)
+        self.phases = phases[keep]
+
+    def __call__(self, walkers):
+        '''
+        Log posterior up to a constant for each walker,
+        -inf outside the prior.
+        '''
+        walkers = np.atleast_2d(np.asarray(walkers, dtype=float))
+        log_probability = np.full(walkers.shape[0], -np.inf)
+        inside = (walkers >= 0).all(axis=1)
+        if self.sample_eccentricity:
+            inside &= walkers[:, 2] <= 1
+        theta = walkers[inside]
+        if not self.sample_eccentricity:
+            value = negative_log_likelihood(theta, self.shape[np.newaxis], self.weights[np.newaxis],
+                                            self.compensator[np.newaxis])
+        else:
+            eccentricity = theta[:, 2]
+            if self.phases is None:
+                shape = self._interpolate(eccentricity, self.shape_grid)
+            else:
+                shape = self.shape_function(self.phases[np.newaxis], eccentricity[:, np.newaxis], self.major_axis_a)
+            compensator = self._interpolate(eccentricity, self.compensator_grid)
+            value = negative_log_likelihood(theta[:, :2], shape, self.weights[np.newaxis], compensator)
+        log_probability[inside] = -value
+        return log_probability
+
+    def _interpolate(self, eccentricity, grid):
+        """Linear interpolation of the rows of a table over
+        eccentricity_grid, one row per eccentricity."""
+        position = np.interp(eccentricity, self.eccentricity_grid, np.arange(len(self.eccentricity_grid)))
+        lower = np.minimum(position.astype(int), len(self.eccentricity_grid) - 2)
+        fraction = (position - lower)[:, np.newaxis]
+        return (1. - fraction) * grid[lower] + fraction * grid[lower + 1]
+
+
+def run_ensemble(log_probability, start, n_steps, seed=None, stretch=2.):
+    """Affine-invariant ensemble sampler with the stretch move
+    (Goodman & Weare 2010). Each half of the ensemble is moved
+    at once, so log_probability is called with a whole array
+    of walkers.
+
+    Parameters:
+    -----------
+    log_probability : function
+        log posterior of an array of walkers (n_walkers, n_dim)
+    start : array (n_walkers, n_dim)
+        initial positions of the walkers
+    n_steps : int
+        number of steps
+    seed : None, int, SeedSequence, or Generator
+        seed of the moves
+    stretch : float
+        scale of the stretch move
+
+    Return:
+    -------
+    chain : array (n_steps, n_walkers, n_dim)
+    acceptance : float
+        fraction of accepted moves
+    """
+    rng = np.random.default_rng(seed)
+    walkers = np.array(start, dtype=float)
+    n_walkers, n_dim = walkers.shape
+    log_p = log_probability(walkers)
+    halves = np.array_split(np.arange(n_walkers), 2)
+    chain = np.empty((n_steps, n_walkers, n_dim))
+    accepted = 0
+    for step in range(n_steps):
+        for active, passive in [halves, halves[::-1]]:
+            z = ((stretch - 1.) * rng.random(len(active)) + 1.)**2 / stretch
+            partners = walkers[rng.choice(passive, size=len(active))]
+            proposal = partners + z[:, np.newaxis] * (walkers[active] - partners)
+            log_p_proposal = log_probability(proposal)
+            with np.errstate(invalid="ignore"):
+                accept = (np.log(rng.random(len(active))) <
+                          (n_dim - 1) * np.log(z) + log_p_proposal - log_p[active])
+            walkers[active[accept]] = proposal[accept]
+            log_p[active[accept]] = log_p_proposal[accept]
+            accepted += accept.sum()
+        chain[step] = walkers
+    return chain, accepted / (n_steps * n_walkers)
+
+
+def sample_posterior(spi_model, n_walkers=32, n_steps=2000, sample_eccentricity=False,
+                     n_chains=1, max_workers=None, seed=None):
+    """Sample the posterior of base and peak, and optionally the
+    eccentricity, with independent ensembles of walkers started
+    around the maximum likelihood estimate. Chains run on a
+    process pool.
+
+    Parameters:
+    -----------
+    spi_model : SPI_Model
+        model with data, orbit, and n_orbits set
+    n_walkers : int
+        number of walkers per chain, at least twice the
+        number of parameters
+    n_steps : int
+        number of steps per chain
+    sample_eccentricity : bool
+        If True, sample the eccentricity too,
+        starting at spi_model.eccentricity.
+    n_chains : int
+        number of independent chains
+    max_workers : int or None
+        number of processes, None uses all cores,
+        1 runs in the current process
+    seed : None, int, or SeedSequence
+        seed of the sampler, chain seeds are spawned from it
+
+    Return:
+    -------
+    chains : array (n_chains, n_steps, n_walkers, n_dim)
+        positions of the walkers, columns base, peak
+        (and eccentricity)
+    acceptance : array (n_chains,)
+        fraction of accepted moves per chain
+    """
+    if spi_model.data is None or len(spi_model.data) == 0:
+        raise ValueError('No input data given.')
+    n_dim = 3 if sample_eccentricity else 2
+    if n_walkers < 2 * n_dim:
+        raise ValueError('Use at least {} walkers.'.format(2 * n_dim))
+    log_probability = LogPosterior(spi_model, sample_eccentricity)
+    if spi_model.MLE_params is None:
+        spi_model.MLE_params = spi_model.estimate_two_parameters()
+    center = np.array(list(spi_model.MLE_params) + ([spi_model.eccentricity] if sample_eccentricity else []),
+                      dtype=float)
+
+    root = np.random.SeedSequence(seed)
+    tasks = []
+    for k in range(n_chains):
+        seeds = np.random.SeedSequence(root.entropy, spawn_key=(k,)).spawn(2)
+        scatter = 1e-3 * (np.abs(center) + 1.) * np.random.default_rng(seeds[0]).standard_normal((n_walkers, n_dim))
+        start = np.abs(center + scatter)
+        if sample_eccentricity:
+            start[:, 2] = np.minimum(start[:, 2], 1.)
+        tasks.append((log_probability, start, n_steps, seeds[1]))
+
+    if max_workers == 1 or n_chains == 1:
+        results = [run_ensemble(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(run_ensemble, *zip(*tasks)))
+    chains = np.array([chain for chain, _ in results])
+    acceptance = np.array([fraction for _, fraction in results])
+    return chains, acceptance
@@ -1,14 +1,102 @@
 import numpy as np
+import threading
+from contextlib import contextmanager
+from functools import lru_cache, wraps
+from scipy.integrate import quad
+
+# Per thread, so that a trusted loop in one thread does not
+# switch off the checks of models evaluated in other threads.
+_TRUSTED = threading.local()
+
+@contextmanager
+def trusted_evaluation():
+    '''Skip the NaN and inf checks of the intensity models
+    inside this context, e.g. in inner loops with inputs that
+    are known to be valid. The unchecked model is also
+    available as model.__wrapped__. The context only applies
+    to the current thread.
+    '''
+    previous, _TRUSTED.value = getattr(_TRUSTED, 'value', False), True
+    try:
+        yield
+    finally:
+        _TRUSTED.value = previous
+
+def check_finite(values):
+    '''Raise a ValueError if any value is NaN or infinite.'''
+    values = np.asarray(values, dtype=float)
+    if not np.isfinite(values).all():
+        if np.isnan(values).any():
+            raise ValueError('NaN-value detected. Check your input parameters.')
+        raise ValueError('Intensity is infinite. Check your input parameters.')
 
 def ContainsNaN(func):
+    @wraps(func)
     def wrapper(*args, **kawrgs):
-        if np.isnan(np.array(func(*args, **kawrgs))).any():
-            raise ValueError('NaN-value detected. Check your input parameters.')
-        elif np.isinf(np.array(func(*args,**kawrgs))).any():
-            raise ValueError('Intensity is infinite. Check your input parameters.')
-        return func(*args, **kawrgs)
+        result = func(*args, **kawrgs)
+        if not getattr(_TRUSTED, 'value', False):
+            check_finite(result)
+        return result
     return wrapper
 
+# The intensity models are all linear in base and peak, i.e.
+# intensity = base + peak * shape(time). The shape terms below
+# only depend on the orbit and can be precomputed.
+
+def shape_absolute_distance_influence(time, eccentricity, major_axis_a = None):
+    return eccentricity + 1 - np.sqrt((eccentricity - np.cos(2*np.pi*(time-1/2)))**2 + (1-eccentricity**2)*(np.sin(2*np.pi*(time-1/2))**2))
+
+def shape_inverse_distance_influence(time, eccentricity, major_axis_a = None):
+    return 1/(1+(np.sqrt((eccentricity - np.cos(2*np.pi*(time-1/2)))**2 + (1-eccentricity**2)*(np.sin(2*np.pi*(time-1/2))**2)))**6)
+
+def shape_absolute_distance_influence_with_maj_axis(time, eccentricity, major_axis_a):
+    b = np.sqrt(major_axis_a**2*(1-eccentricity**2))
+    return (np.sqrt(major_axis_a**2-b**2) + major_axis_a - np.sqrt((np.sqrt(major_axis_a**2-b**2)
+                                                                    - major_axis_a*np.cos(2*np.pi*(time-1/2)))**2 + b**2*(np.sin(2*np.pi*(time-1/2))**2)))
+
+def shape_inverse_distance_influence_with_maj_axis(time, eccentricity, major_axis_a):
+    b = np.sqrt(major_axis_a**2*(1-eccentricity**2))
+    return 1/(1+(np.sqrt((np.sqrt(major_axis_a**2-b**2) - major_axis_a*np.cos(2*np.pi*(time-1/2)))**2 + b**2*(np.sin(2*np.pi*(time-1/2))**2)))**6)
+
+@lru_cache(maxsize=1024)
+def shape_integral(shape, eccentricity, major_axis_a = None):
+    '''Integral of a shape term over one orbit, i.e. from phase 0 to 1.
+    Cached, so that the compensator of the likelihood is only integrated
+    once per shape, eccentricity and major axis.
+    '''
+    return quad(lambda x: shape(x, eccentricity, major_axis_a), 0, 1)[0]
+
+@lru_cache(maxsize=256)
+def shape_bin_integrals(shape, eccentricity, major_axis_a = None, n_bins = 100):
+    '''Integrals of a shape term over n_bins equal phase bins
+    between 0 and 1. Cached like :func:`shape_integral`, the
+    returned array is read-only.
+    '''
+    edges = np.linspace(0, 1, n_bins + 1)
+    integrals = np.array([quad(lambda x: shape(x, eccentricity, major_axis_a), lo, hi)[0]
+                          for lo, hi in zip(edges[:-1], edges[1:])])
+    integrals.flags.writeable = False
+    return integrals
+
+# Gradients of the intensity models with respect to base and peak.
+# Because the models are linear in both, the second derivatives vanish.
+
+def gradient_model_absolute_distance_influence(time, base, peak, eccentricity, major_axis_a = None):
+    shape = shape_absolute_distance_influence(time, eccentricity)
+    return np.array([np.ones_like(shape), shape])
+
+def gradient_model_inverse_distance_influence(time, base, peak, eccentricity, major_axis_a = None):
+    shape = shape_inverse_distance_influence(time, eccentricity)
+    return np.array([np.ones_like(shape), shape])
+
+def gradient_model_absolute_distance_influence_with_maj_axis(time, base, peak, eccentricity, major_axis_a):
+    shape = shape_absolute_distance_influence_with_maj_axis(time, eccentricity, major_axis_a)
+    return np.array([np.ones_like(shape), shape])
+
+def gradient_model_inverse_distance_influence_with_maj_axis(time, base, peak, eccentricity, major_axis_a):
+    shape = shape_inverse_distance_influence_with_maj_axis(time, eccentricity, major_axis_a)
+    return np.array([np.ones_like(shape), shape])
+
 @ContainsNaN
 def model_absolute_distance_influence(time, base, peak, eccentricity, major_axis_a =None):
     if eccentricity > 1 or eccentricity < 0:
@@ -17,7 +105,7 @@ def model_absolute_distance_influence(time, base, peak, eccentricity, major_axis
         raise KeyError('The base rate has to be non-negative')
     elif peak < 0: 
         raise KeyError('The peak has to have non-negative height.')
-    return base + peak*(eccentricity + 1 - np.sqrt((eccentricity - np.cos(2*np.pi*(time-1/2)))**2 + (1-eccentricity**2)*(np.sin(2*np.pi*(time-1/2))**2)))
+    return base + peak*shape_absolute_distance_influence(time, eccentricity)
 
 @ContainsNaN   
 def model_inverse_distance_influence(time, base, peak, eccentricity, major_axis_a = None):
@@ -28,7 +116,7 @@ def model_inverse_distance_influence(time, base, peak, eccentricity, major_axis_
     elif peak < 0: 
         raise KeyError('The peak has to have non-negative height.')
     
-    return base + peak/(1+(np.sqrt((eccentricity - np.cos(2*np.pi*(time-1/2)))**2 + (1-eccentricity**2)*(np.sin(2*np.pi*(time-1/2))**2)))**6)
+    return base + peak*shape_inverse_distance_influence(time, eccentricity)
 
 @ContainsNaN
 def model_absolute_distance_influence_with_maj_axis(time, base, peak, eccentricity, major_axis_a):
@@ -38,9 +126,7 @@ def model_absolute_distance_influence_with_maj_axis(time, base, peak, eccentrici
         raise KeyError('The base rate has to be positive')
     elif peak < 0: 
         raise KeyError('The peak has to have non-negative height.')
-    b = np.sqrt(major_axis_a**2*(1-eccentricity**2))
-    return base + peak*(np.sqrt(major_axis_a**2-b**2) + major_axis_a - np.sqrt((np.sqrt(major_axis_a**2-b**2) 
-                                                                               - major_axis_a*np.cos(2*np.pi*(time-1/2)))**2 + b**2*(np.sin(2*np.pi*(time-1/2))**2)))
+    return base + peak*shape_absolute_distance_influence_with_maj_axis(time, eccentricity, major_axis_a)
     
 @ContainsNaN
 def model_inverse_distance_influence_with_maj_axis(time, base, peak, eccentricity, major_axis_a):
@@ -50,6 +136,5 @@ def model_inverse_distance_influence_with_maj_axis(time, base, peak, eccentricit
         raise KeyError('The base rate has to be positive')
     elif peak < 0: 
         raise KeyError('The peak has to have non-negative height.')
-    b = np.sqrt(major_axis_a**2*(1-eccentricity**2))
-    return base + peak/(1+(np.sqrt((np.sqrt(major_axis_a**2-b**2) - major_axis_a*np.cos(2*np.pi*(time-1/2)))**2 + b**2*(np.sin(2*np.pi*(time-1/2))**2)))**6)
+    return base + peak*shape_inverse_distance_influence_with_maj_axis(time, eccentricity, major_axis_a)
         
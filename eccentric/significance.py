@@ -0,0 +1,166 @@
+# Python 3.5
+# Significance of the SPI peak against a homogeneous Poisson process.
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .models import shape_bin_integrals
+from .likelihood import fit_newton, ChunkedModel, BinnedModel
+
+
+def homogeneous_negative_log_likelihood(n_events, n_orbits):
+    """Negative log likelihood of the best-fitting
+    homogeneous Poisson process, base = n_events / n_orbits.
+    """
+    n_events = np.asarray(n_events, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = n_events - n_events * np.log(n_events / n_orbits)
+    return np.where(n_events > 0, value, 0.)
+
+
+def likelihood_ratio_statistic(shape, weights, compensator):
+    """Twice the log likelihood ratio of base + peak * shape
+    over a homogeneous process for each data set.
+
+    Parameters:
+    -----------
+    shape, weights, compensator : arrays
+        as in :func:`likelihood.negative_log_likelihood`
+    """
+    _, value = fit_newton(shape, weights, compensator)
+    null = homogeneous_negative_log_likelihood(weights.sum(axis=1), compensator[:, 0])
+    return np.maximum(2. * (null - value), 0.)
+
+
+def simulate_null_statistics(seed, n_simulations, expected_events, shape,
+                             eccentricity, major_axis_a, compensator, exposure=None, n_bins=None):
+    """Simulate stacks from a homogeneous Poisson process,
+    refit them in one batch and return their likelihood ratio statistics.
+
+    Parameters:
+    -----------
+    seed : int, SeedSequence, or Generator
+        seed of this batch of simulations
+    n_simulations : int
+        number of simulated stacks
+    expected_events : float
+        expected number of events per stack
+    shape : function
+        shape term of the intensity model
+    eccentricity, major_axis_a : float
+        orbit of the model
+    compensator : array
+        integral of the intensity over all orbits
+        per unit base and per unit peak
+    exposure : array or None
+        observed time per phase bin, see :mod:`exposure`.
+        Phases are then drawn in proportion to the exposure,
+        else uniformly.
+    n_bins : int or None
+        If given, the simulated phases are binned and fitted
+        with the mean shape per bin, as in a
+        :class:`likelihood.BinnedModel`, else unbinned.
+    """
+    rng = np.random.default_rng(seed)
+    n_events = rng.poisson(expected_events, size=n_simulations)
+    size = (n_simulations, n_events.max(initial=0))
+    if exposure is None:
+        phases = rng.random(size)
+    else:
+        # pick a bin by its exposure, then a uniform phase inside it
+        exposure = np.asarray(exposure, dtype=float)
+        bins = rng.choice(exposure.shape[0], size=size, p=exposure / exposure.sum())
+        phases = (bins + rng.random(size)) / exposure.shape[0]
+    weights = (np.arange(phases.shape[1]) < n_events[:, np.newaxis]).astype(float)
+    if n_bins is None:
+        shape_at_events = np.where(weights > 0, shape(phases, eccentricity, major_axis_a), 0.)
+    else:
+        bins = np.minimum((phases * n_bins).astype(int), n_bins - 1)
+        bins += n_bins * np.arange(n_simulations)[:, np.newaxis]
+        weights = np.bincount(bins.ravel(), weights=weights.ravel(),
+                              minlength=n_simulations * n_bins).reshape(n_simulations, n_bins)
+        bin_shape = n_bins * shape_bin_integrals(shape, eccentricity, major_axis_a, n_bins)
+        shape_at_events = np.tile(bin_shape, (n_simulations, 1))
+    compensator = np.tile(compensator, (n_simulations, 1))
+    return likelihood_ratio_statistic(shape_at_events, weights, compensator)
+
+
+def likelihood_ratio_test(spi_model, n_simulations=10000, precision=0.005, batch_size=250,
+                          max_workers=None, seed=None):
+    """Likelihood ratio test of the fitted SPI peak against
+    a homogeneous Poisson process. The null distribution of the
+    statistic comes from a parametric bootstrap: homogeneous stacks
+    with the observed mean number of events are simulated and refitted
+    in batches on a process pool. With an exposure, the simulated
+    events follow the observed phase coverage. Simulation stops when
+    the standard error of the p-value is below precision, or after
+    n_simulations. With binned data, the simulated stacks are binned
+    the same way, so that statistic and null distribution match.
+
+    Parameters:
+    -----------
+    spi_model : SPI_Model
+        model with data, orbit, and n_orbits set
+    n_simulations : int
+        maximum number of simulated stacks
+    precision : float
+        target standard error of the p-value
+    batch_size : int
+        number of stacks simulated and fitted at once
+    max_workers : int or None
+        number of processes, None uses all cores,
+        1 runs in the current process
+    seed : None, int, or SeedSequence
+        seed of the bootstrap, batch seeds are spawned from it
+
+    Return:
+    -------
+    statistic, p-value, and number of simulated stacks
+    """
+    if spi_model.data is None or len(spi_model.data) == 0:
+        raise ValueError('No input data given.')
+    compiled = spi_model.compile()
+    if isinstance(compiled, ChunkedModel):
+        raise TypeError('The likelihood ratio test needs the shape terms in memory, chunked data is not supported.')
+    shape = spi_model.shape_function()
+    statistic = likelihood_ratio_statistic(compiled.shape[np.newaxis], compiled.weights[np.newaxis],
+                                           compiled.compensator[np.newaxis])[0]
+
+    root = np.random.SeedSequence(seed)
+    n_batches = int(np.ceil(n_simulations / batch_size))
+    tasks = [(np.random.SeedSequence(root.entropy, spawn_key=(i,)),
+              min(batch_size, n_simulations - i * batch_size),
+              compiled.weights.sum(), shape, compiled.eccentricity,
+              compiled.major_axis_a, compiled.compensator, spi_model.exposure,
+              compiled.n_bins if isinstance(compiled, BinnedModel) else None)
+             for i in range(n_batches)]
+
+    # batches are counted in order, so the result does
+    # not depend on which worker finishes first
+    exceed, simulated = 0, 0
+    def resolved():
+        p_value = (1. + exceed) / (1. + simulated)
+        return simulated > 0 and np.sqrt(p_value * (1. - p_value) / simulated) < precision
+
+    if max_workers == 1:
+        for task in tasks:
+            null = simulate_null_statistics(*task)
+            exceed, simulated = exceed + (null >= statistic).sum(), simulated + len(null)
+            if resolved():
+                break
+    else:
+        n_parallel = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(simulate_null_statistics, *task) for task in tasks[:n_parallel]]
+            for i in range(n_batches):
+                null = futures[i].result()
+                exceed, simulated = exceed + (null >= statistic).sum(), simulated + len(null)
+                if resolved():
+                    break
+                if i + n_parallel < n_batches:
+                    futures.append(executor.submit(simulate_null_statistics, *tasks[i + n_parallel]))
+            for future in futures:
+                future.cancel()
+
+    return statistic, (1. + exceed) / (1. + simulated), simulated
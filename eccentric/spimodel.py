@@ -8,54 +8,164 @@ Created on Thu Oct 24 10:57:38 2019
 
 import warnings
 import numpy as np
-from scipy.integrate import quad
 from scipy.optimize import minimize 
 from .models import *
+from .helper import random_generator
+from .likelihood import CompiledModel, ChunkedModel, BinnedModel, fit_newton, is_chunk_list
+from .exposure import exposure_compensator
+from .cache import FitCache, fit_key
 
 class SPI_Model():
     '''
     
     '''
     
-    def __init__(self, major_axis_a = None, eccentricity = 0.5, data = None, model = 'absolute_distance_influence', n_orbits = None):
+    def __init__(self, major_axis_a = None, eccentricity = 0.5, data = None, model = 'absolute_distance_influence', n_orbits = None,
+                 chunk_size = None, exposure = None, n_bins = None, cache = None):
         '''
-        
+        data can be an array of stacked event phases, a memory-mapped
+        array, or a list of arrays (chunks). Memory-mapped arrays, lists,
+        and any data with chunk_size set are evaluated chunk by chunk,
+        see :class:`ChunkedModel`.
+        exposure is the observed time per phase bin in orbits for
+        data with gaps, see :mod:`exposure`. It replaces n_orbits
+        in the compensator.
+        n_bins switches from the exact unbinned likelihood to the
+        binned likelihood on n_bins phase bins, see :class:`BinnedModel`.
+        cache is a FitCache or a cache directory, where maximum likelihood
+        estimates are looked up before fitting, see :mod:`cache`.
+        Arrays of data and exposure are copied into read-only arrays,
+        so assign new arrays instead of changing them in place.
+        Memory-mapped arrays and chunks are kept as they are, and must
+        not be changed while the model is in use.
         '''
+        self._compiled = None
+        self._data_buffer = None
         self.major_axis_a = major_axis_a
         self.eccentricity = eccentricity
         self.n_orbits = n_orbits
         self.model = model
         self.data = data
+        self.chunk_size = chunk_size
+        self.exposure = exposure
+        self.n_bins = n_bins
+        self.cache = cache
         self.hom = []
         self.inhom = []
+        self.inhom_probability = None
+        self.inhom_mask = None
         self.MLE_params = None
-        
-    def intensity_function(self):
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # a private, read-only copy, so that the compiled model cannot go stale;
+        # lists of arrays are chunks, plain sequences of phases are copied too
+        if data is not None and not (is_chunk_list(data) or isinstance(data, np.memmap)):
+            data = np.array(data, dtype=float)
+            data.flags.writeable = False
+        self._data = data
+        self._compiled = None
+
+    @property
+    def exposure(self):
+        return self._exposure
+
+    @exposure.setter
+    def exposure(self, exposure):
+        if exposure is not None:
+            exposure = np.array(exposure, dtype=float)
+            exposure.flags.writeable = False
+        self._exposure = exposure
+        self._compiled = None
+
+    def _model_name(self):
         '''
-        
+        Name of the intensity model that matches the model
+        string and the given orbital hyperparameters.
         '''
-        model_dictionary = {'model_absolute_distance_influence' : model_absolute_distance_influence,
-         'model_inverse_distance_influence' : model_inverse_distance_influence,
-         'model_absolute_distance_influence_with_maj_axis' : model_absolute_distance_influence_with_maj_axis,
-         'model_inverse_distance_influence_with_maj_axis' : model_inverse_distance_influence_with_maj_axis}
-        
         if self.model not in ['absolute_distance_influence', 'inverse_distance_influence']:
             raise KeyError('Name not available among models. Use "absolute_distance_influence" or "inverse_distance_influence" instead.')
         else:    
             if self.major_axis_a is None and self.eccentricity is not None:
                 warnings.warn('Length of major axis not set. Using eccentricity only.')
-                if self.model == 'absolute_distance_influence': # goal in the end to estimate "base" and "peak". a and b are hyperparameters
-                    return model_dictionary['model_absolute_distance_influence']
-                elif self.model == 'inverse_distance_influence':
-                    return model_dictionary['model_inverse_distance_influence']
+                return 'model_' + self.model # goal in the end to estimate "base" and "peak". a and b are hyperparameters
             elif self.major_axis_a is not None and self.eccentricity is not None:
-                if self.model == 'absolute_distance_influence':
-                    return model_dictionary['model_absolute_distance_influence_with_maj_axis']
-                elif self.model == 'inverse_distance_influence':
-                    return model_dictionary['model_inverse_distance_influence_with_maj_axis']
+                return 'model_' + self.model + '_with_maj_axis'
             else:
                 raise ValueError('At least eccentricity has to be passed to SPI_Model.')
-                
+
+    def intensity_function(self):
+        '''
+        
+        '''
+        model_dictionary = {'model_absolute_distance_influence' : model_absolute_distance_influence,
+         'model_inverse_distance_influence' : model_inverse_distance_influence,
+         'model_absolute_distance_influence_with_maj_axis' : model_absolute_distance_influence_with_maj_axis,
+         'model_inverse_distance_influence_with_maj_axis' : model_inverse_distance_influence_with_maj_axis}
+        return model_dictionary[self._model_name()]
+
+    def shape_function(self):
+        '''
+        Shape term of the intensity function, i.e.
+        intensity = base + peak * shape.
+        '''
+        shape_dictionary = {'model_absolute_distance_influence' : shape_absolute_distance_influence,
+         'model_inverse_distance_influence' : shape_inverse_distance_influence,
+         'model_absolute_distance_influence_with_maj_axis' : shape_absolute_distance_influence_with_maj_axis,
+         'model_inverse_distance_influence_with_maj_axis' : shape_inverse_distance_influence_with_maj_axis}
+        return shape_dictionary[self._model_name()]
+
+    def gradient_function(self):
+        '''
+        Gradient of the intensity function with
+        respect to base and peak.
+        '''
+        gradient_dictionary = {'model_absolute_distance_influence' : gradient_model_absolute_distance_influence,
+         'model_inverse_distance_influence' : gradient_model_inverse_distance_influence,
+         'model_absolute_distance_influence_with_maj_axis' : gradient_model_absolute_distance_influence_with_maj_axis,
+         'model_inverse_distance_influence_with_maj_axis' : gradient_model_inverse_distance_influence_with_maj_axis}
+        return gradient_dictionary[self._model_name()]
+
+    def _chunked(self):
+        '''
+        True if the data are evaluated chunk by chunk.
+        '''
+        return self.chunk_size is not None or is_chunk_list(self.data) or isinstance(self.data, np.memmap)
+
+    def _compile_key(self):
+        # data and exposure reset the compiled model when assigned
+        return (self.eccentricity, self.major_axis_a, self.model, self.n_orbits, self.chunk_size, self.n_bins)
+
+    def compile(self):
+        '''
+        Intensity model compiled for the current data and orbit,
+        see :class:`CompiledModel`, :class:`ChunkedModel` for chunked
+        data, or :class:`BinnedModel` if n_bins is set. No data compiles
+        to an empty model. It is rebuilt only
+        when data, eccentricity, major axis, model, n_orbits, chunk_size,
+        exposure or n_bins are assigned.
+        '''
+        key = self._compile_key()
+        if self._compiled is None or self._compiled[0] != key:
+            data = self.data if self.data is not None else np.empty(0)
+            if self.n_bins is not None:
+                compiled = BinnedModel(data, self.shape_function(), self.eccentricity,
+                                       self.major_axis_a, self.n_orbits, n_bins = self.n_bins,
+                                       chunk_size = self.chunk_size or 1 << 20, exposure = self.exposure)
+            elif self._chunked():
+                compiled = ChunkedModel(data, self.shape_function(), self.eccentricity,
+                                        self.major_axis_a, self.n_orbits,
+                                        chunk_size = self.chunk_size or 1 << 20, exposure = self.exposure)
+            else:
+                compiled = CompiledModel(data, self.shape_function(), self.eccentricity,
+                                         self.major_axis_a, self.n_orbits, exposure = self.exposure)
+            self._compiled = (key, compiled)
+        return self._compiled[1]
+
     def _negative_likelihood_function(self, parameters):
         '''
         
@@ -63,13 +173,28 @@ class SPI_Model():
         if np.nan in parameters:
             raise ValueError('Negative likelihood function received at least one nan-value but needs two floats.')
         # use equation sum lambda(x_i) - int lambda(x) dx
-        # negative log likelihood to estimate parameters for a model depending on exactly two parameters
-        parameter_a, parameter_b = parameters
-        model = self.intensity_function()
-        data_depending_term = -np.log(model(self.data, parameter_a, parameter_b, self.eccentricity, self.major_axis_a)).sum()
-        compensator = self.n_orbits*quad(lambda x: model(x, parameter_a, parameter_b, self.eccentricity, self.major_axis_a),0,1)[0]
-        return data_depending_term + compensator
-        
+        # negative log likelihood to estimate parameters for a model depending on exactly two parameters.
+        # The intensity is linear in both parameters, so the compiled model only
+        # needs base + peak * shape at the data, and the cached integral over the shape.
+        return self.compile().negative_log_likelihood(parameters)
+
+    def _negative_likelihood_gradient(self, parameters):
+        '''
+        Analytic gradient of the negative log likelihood
+        with respect to base and peak.
+        '''
+        if np.nan in parameters:
+            raise ValueError('Negative likelihood gradient received at least one nan-value but needs two floats.')
+        return self.compile().gradient(parameters)
+
+    def _negative_likelihood_hessian(self, parameters):
+        '''
+        Analytic Hessian of the negative log likelihood
+        with respect to base and peak. The compensator is
+        linear in both parameters and does not contribute.
+        '''
+        return self.compile().hessian(parameters)
+
     def estimate_two_parameters(self):
         '''
         
@@ -79,20 +204,166 @@ class SPI_Model():
         # data as 1:n array
         # function depends on time, a, and b, represents intensity
         # data: event times
-        max_likelihood_a, max_likelihood_b = minimize(self._negative_likelihood_function, [1,1], bounds = ((0, None), (0, None)))['x']
+        if self.cache is not None:
+            cache = self.cache if isinstance(self.cache, FitCache) else FitCache(self.cache)
+            key = fit_key(self.data, fit = 'estimate_two_parameters', model = self.model,
+                          eccentricity = self.eccentricity, major_axis_a = self.major_axis_a,
+                          n_orbits = self.n_orbits, exposure = self.exposure, n_bins = self.n_bins)
+            cached = cache.get(key)
+            if cached is not None:
+                return tuple(cached)
+        # value and gradient come from one pass over the data
+        max_likelihood_a, max_likelihood_b = minimize(self.compile().value_and_gradient, [1,1], jac = True,
+                                                      bounds = ((0, None), (0, None)))['x']
+        if self.cache is not None:
+            cache.put(key, [max_likelihood_a, max_likelihood_b])
         return max_likelihood_a, max_likelihood_b
 
-    def thinning(self):
+    def update(self, events, n_orbits = 0., exposure = None):
         '''
-        
+        Append new events, and the orbits or exposure observed since
+        the last update, and refit. The compiled model is extended in
+        place in O(new events), and the fit is warm-started from the
+        previous maximum likelihood estimate. With n_bins set, the
+        refit costs O(n_bins) regardless of the number of events.
+
+        Streaming can start from a model without data or n_orbits,
+        which are then taken to be empty and 0.
+
+        Returns the new maximum likelihood estimates of base and peak,
+        also stored in MLE_params.
         '''
-        model = self.intensity_function()
-        if self.MLE_params == None:
-            self.MLE_params  = self.estimate_two_parameters()
-        for event in self.data:
-            u = np.random.rand()
-            if u < (model(event, self.MLE_params[0], self.MLE_params[1],self.eccentricity, self.major_axis_a) - 
-                    self.MLE_params[0]) / model(event, self.MLE_params[0], self.MLE_params[1], self.eccentricity, self.major_axis_a):
-                self.inhom.append(event)
+        events = np.asarray(events, dtype=float).ravel()
+        if self.data is None:
+            self.data = np.empty(0)
+        if self.n_orbits is None:
+            self.n_orbits = 0.
+        compiled = self.compile()
+        compiled.append(events, n_orbits, exposure)
+        if is_chunk_list(self.data):
+            self._data = list(self.data) + [events]
+        elif isinstance(self.data, np.memmap):
+            self._data = [self.data, events]
+        else:
+            n, total = len(self.data), len(self.data) + len(events)
+            if (self._data_buffer is None or getattr(self.data, 'base', None) is not self._data_buffer
+                    or total > len(self._data_buffer)):
+                self._data_buffer = np.empty(max(total, 2 * n, 1024))
+                self._data_buffer[:n] = np.asarray(self.data, dtype=float)
+            self._data_buffer[n:total] = events
+            self._data = self._data_buffer[:total]
+            self._data.flags.writeable = False
+        # extend data, orbits and exposure in step with the compiled model
+        self.n_orbits, self._exposure = compiled.n_orbits, compiled.exposure
+        self._compiled = (self._compile_key(), compiled)
+
+        if self.MLE_params is None:
+            self.MLE_params = self.estimate_two_parameters()
+            return self.MLE_params
+        n_events = compiled.n_events if isinstance(compiled, ChunkedModel) else compiled.weights.sum()
+        if n_events == 0:
+            raise ValueError('No input data given.')
+        # keep the base away from 0, where the intensity may vanish at an event
+        start = np.array(self.MLE_params, dtype=float)
+        start[0] = max(start[0], 1e-3 * n_events / compiled.compensator[0])
+        if isinstance(compiled, ChunkedModel):
+            self.MLE_params = tuple(minimize(compiled.value_and_gradient, start, jac = True,
+                                             bounds = ((0, None), (0, None)))['x'])
+        else:
+            theta, _ = fit_newton(compiled.shape[np.newaxis], compiled.weights[np.newaxis],
+                                  compiled.compensator[np.newaxis], theta = start[np.newaxis])
+            self.MLE_params = tuple(theta[0])
+        return self.MLE_params
+
+    def standard_errors(self, parameters = None):
+        '''
+        Standard errors of base and peak from the inverse
+        of the analytic Hessian of the negative log likelihood.
+        Evaluated at the maximum likelihood estimate
+        unless other parameters are given.
+        '''
+        if parameters is None:
+            if self.MLE_params is None:
+                self.MLE_params = self.estimate_two_parameters()
+            parameters = self.MLE_params
+        covariance = np.linalg.inv(self._negative_likelihood_hessian(parameters))
+        return np.sqrt(np.diag(covariance))
+
+    def profile_likelihood(self, eccentricities, phase_shifts = (0.,)):
+        '''
+        Log likelihood maximized over base and peak on a grid of
+        eccentricities and phase shifts. A phase shift moves the
+        intensity to later phases, i.e. intensity(phase - shift).
+        All phase shifts for one eccentricity are fitted at once,
+        and the shape integral only depends on the eccentricity.
+        With an exposure, phase shifts are rounded to whole bins
+        in the compensator.
+
+        Returns the log likelihood and the estimates of base and peak,
+        arrays of shape (eccentricities, phase_shifts) and
+        (eccentricities, phase_shifts, 2).
+        '''
+        if self.data is None or len(self.data) == 0:
+            raise ValueError('No input data given.')
+        if self._chunked():
+            raise TypeError('The profile likelihood needs the events in memory, chunked data is not supported.')
+        eccentricities = np.atleast_1d(np.asarray(eccentricities, dtype=float))
+        phase_shifts = np.atleast_1d(np.asarray(phase_shifts, dtype=float))
+        if ((eccentricities > 1) | (eccentricities < 0)).any():
+            raise KeyError('The eccentricity has to be between 0 and 1.')
+        shape = self.shape_function()
+        shifted = np.asarray(self.data, dtype=float)[np.newaxis, :] - phase_shifts[:, np.newaxis]
+        weights = np.ones_like(shifted)
+        log_likelihood = np.empty((len(eccentricities), len(phase_shifts)))
+        params = np.empty((len(eccentricities), len(phase_shifts), 2))
+        for i, eccentricity in enumerate(eccentricities):
+            if self.exposure is None:
+                shape_term = shape_integral(shape, eccentricity, self.major_axis_a)
+                compensator = np.tile(self.n_orbits * np.array([1., shape_term]), (len(phase_shifts), 1))
             else:
-                self.hom.append(event)
+                # the exposure moves with the phase shift, by whole bins
+                n_bins = len(self.exposure)
+                compensator = np.array([exposure_compensator(shape, eccentricity,
+                                                             np.roll(self.exposure, -int(np.rint(shift * n_bins))),
+                                                             self.major_axis_a)
+                                        for shift in phase_shifts])
+            theta, value = fit_newton(shape(shifted, eccentricity, self.major_axis_a), weights, compensator)
+            log_likelihood[i], params[i] = -value, theta
+        return log_likelihood, params
+
+    def thinning(self, seed = None, n_realizations = 1):
+        '''
+        Assign each event to the homogeneous (intrinsic) or
+        inhomogeneous (SPI) part of the process.
+        seed can be None (global numpy random state), an int,
+        a SeedSequence, or a Generator.
+
+        Sets inhom_probability, the probability of each event to
+        belong to the inhomogeneous part, and inhom_mask of shape
+        (n_realizations, number of events) with one thinning draw
+        per row. hom and inhom hold the events of the first draw.
+
+        Returns the fraction of draws in which each event
+        was assigned to the inhomogeneous part.
+        '''
+        rng = random_generator(seed)
+        if self.MLE_params is None:
+            self.MLE_params  = self.estimate_two_parameters()
+        compiled = self.compile()
+        if isinstance(compiled, ChunkedModel):
+            data = np.concatenate(list(compiled.chunks()) + [np.array([])])
+        elif is_chunk_list(self.data):
+            data = np.concatenate([np.asarray(part, dtype=float) for part in self.data] + [np.array([])])
+        else:
+            data = np.asarray(self.data)
+        if isinstance(compiled, BinnedModel):
+            # thin with the exact intensity at each event
+            intensity = self.MLE_params[0] + self.MLE_params[1] * self.shape_function()(
+                data, self.eccentricity, self.major_axis_a)
+        else:
+            intensity = compiled.intensity(self.MLE_params)
+        self.inhom_probability = (intensity - self.MLE_params[0]) / intensity
+        self.inhom_mask = rng.random((n_realizations, data.shape[0])) < self.inhom_probability
+        self.inhom = list(data[self.inhom_mask[0]])
+        self.hom = list(data[~self.inhom_mask[0]])
+        return self.inhom_mask.mean(axis=0)
@@ -0,0 +1,178 @@
+# Python 3.5
+# Injection-recovery sweeps over synthetic flare parameters.
+
+import csv
+import itertools
+import warnings
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .synthetic import SyntheticFlares, HotJupiterHost
+from .spimodel import SPI_Model
+from .campaign import CampaignWriter, flare_records
+
+GRID_PARAMETERS = ["period", "eccentricity", "phase", "width", "size", "flares_per_day"]
+
+RESULT_COLUMNS = (["task", "realization", "seed"] + GRID_PARAMETERS +
+                  ["n_flares", "n_intrinsic", "n_spi", "n_ambiguous",
+                   "base", "peak", "n_hom", "n_inhom"])
+
+
+def make_grid(period, eccentricity, phase, width, size, flares_per_day, n_realizations=1):
+    """Build the full grid of injection-recovery tasks.
+
+    Parameters:
+    -----------
+    period, eccentricity, phase, width, size, flares_per_day : lists
+        values to sweep over, see :class:`SyntheticFlares` and
+        :func:`SyntheticFlares._spi_flares_gauss`
+    n_realizations : int
+        number of random realizations per grid point
+
+    Return:
+    -------
+    list of dicts, one per realization
+    """
+    grid = itertools.product(period, eccentricity, phase, width, size, flares_per_day,
+                             range(n_realizations))
+    return [dict(zip(GRID_PARAMETERS + ["realization"], values)) for values in grid]
+
+
+def task_seed(seed, task):
+    """Seed of a single task, derived from the sweep seed
+    and the task index. Tasks get independent streams
+    and every task can be re-run on its own.
+    """
+    return int(np.random.SeedSequence(seed, spawn_key=(task,)).generate_state(1)[0])
+
+
+def run_realization(task):
+    """Generate one synthetic flare table, fit the
+    SPI model to it, and thin it.
+
+    Parameters:
+    -----------
+    task : dict
+        grid parameters, "seed", and the keyword arguments
+        "observation_deltat", "cadence", "first_observation_time",
+        "major_axis_a", "model", "keep_flares", and "cache"
+
+    Return:
+    -------
+    dict with one row of results, and if keep_flares is set,
+    the flare and parameter records under "flares"
+    """
+    rng = np.random.default_rng(int(task["seed"]))
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=task["period"], e=task["eccentricity"],
+                                               a=task["major_axis_a"]),
+                         observation_deltat=task["observation_deltat"],
+                         cadence=task["cadence"],
+                         flares_per_day=task["flares_per_day"],
+                         first_observation_time=task["first_observation_time"],
+                         seed=rng)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        sf.generate_synthetic_flares(model="Gauss", phase=task["phase"],
+                                     width=task["width"], size=task["size"])
+        spi = SPI_Model(major_axis_a=sf.hjhost.major_axis_a,
+                        eccentricity=sf.hjhost.eccentricity,
+                        data=sf.all_flares.stacked_peak_time.values,
+                        model=task["model"],
+                        n_orbits=sf.observation_deltat / sf.hjhost.period,
+                        cache=task.get("cache"))
+        base, peak, n_hom, n_inhom = np.nan, np.nan, 0, 0
+        if len(spi.data) > 0:
+            spi.thinning(seed=rng)
+            base, peak = spi.MLE_params
+            n_hom, n_inhom = len(spi.hom), len(spi.inhom)
+
+    counts = sf.all_flares.source.value_counts()
+    result = {key: task[key] for key in ["task", "realization", "seed"] + GRID_PARAMETERS}
+    result.update({"n_flares": sf.all_flares.shape[0],
+                   "n_intrinsic": counts.get("intrinsic", 0),
+                   "n_spi": counts.get("spi", 0),
+                   "n_ambiguous": counts.get("ambiguous", 0),
+                   "base": base, "peak": peak,
+                   "n_hom": n_hom, "n_inhom": n_inhom})
+    if task.get("keep_flares", False):
+        result["flares"] = (flare_records(sf), sf.parameter_record())
+    return result
+
+
+def run_sweep(grid, path="sweep.csv", observation_deltat=105, cadence=6,
+              first_observation_time=0., major_axis_a=1.,
+              model="absolute_distance_influence", seed=0,
+              max_workers=None, chunksize=1, campaign=None, cache=None):
+    """Run an injection-recovery sweep on a process pool
+    and stream the results to a .csv file as they come in.
+
+    Parameters:
+    -----------
+    grid : list of dicts
+        tasks as returned by :func:`make_grid`
+    path : str
+        Path to the output .csv file, one row per realization
+    observation_deltat, cadence, first_observation_time : float
+        observation setup for :class:`SyntheticFlares`
+    major_axis_a : float
+        major axis of the orbit
+    model : str
+        intensity model to fit, see :class:`SPI_Model`
+    seed : int
+        seed of the sweep, task seeds are derived from it
+    max_workers : int or None
+        number of processes, None uses all cores,
+        1 runs the sweep in the current process
+    chunksize : int
+        number of tasks sent to a worker at a time
+    campaign : str or None
+        If given, the flare tables of all realizations are
+        appended to this campaign file, see :class:`CampaignWriter`,
+        with the task index as realization id.
+    cache : str or None
+        If given, fit results are cached in this directory,
+        see :class:`cache.FitCache`, so that a restarted sweep
+        skips all fits it has already done.
+
+    Return:
+    -------
+    number of realizations written
+    """
+    settings = {"observation_deltat": observation_deltat, "cadence": cadence,
+                "first_observation_time": first_observation_time,
+                "major_axis_a": major_axis_a, "model": model,
+                "keep_flares": campaign is not None, "cache": cache}
+    tasks = [dict(task, task=i, seed=task_seed(seed, i), **settings)
+             for i, task in enumerate(grid)]
+
+    writer = CampaignWriter(campaign, mode="w") if campaign is not None else None
+    try:
+        with open(path, "w", newline="") as file:
+            csv_writer = csv.DictWriter(file, fieldnames=RESULT_COLUMNS)
+            csv_writer.writeheader()
+            if max_workers == 1:
+                results = map(run_realization, tasks)
+                written = _write_results(results, csv_writer, file, writer)
+            else:
+                with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                    results = executor.map(run_realization, tasks, chunksize=chunksize)
+                    written = _write_results(results, csv_writer, file, writer)
+    finally:
+        if writer is not None:
+            writer.close()
+    return written
+
+
+def _write_results(results, csv_writer, file, writer=None):
+    """Write rows as they arrive, so that a crashed
+    sweep keeps everything computed so far."""
+    written = 0
+    for result in results:
+        if writer is not None:
+            records, parameters = result.pop("flares")
+            writer.append_records(records, parameters, realization=result["task"])
+            writer.flush()
+        csv_writer.writerow(result)
+        file.flush()
+        written += 1
+    return written
@@ -4,7 +4,21 @@
 import numpy as np
 import pandas as pd
 from warnings import warn
-from .helper import find_nearest
+from .helper import (find_nearest, find_nearest_on_grid,
+                     sample_without_replacement, random_generator)
+from .exposure import exposure_from_intervals
+from .models import (model_absolute_distance_influence,
+                     model_inverse_distance_influence,
+                     model_absolute_distance_influence_with_maj_axis,
+                     model_inverse_distance_influence_with_maj_axis,
+                     trusted_evaluation)
+
+SOURCES = ["intrinsic", "spi", "ambiguous"]
+
+PARAMETER_DTYPE = np.dtype([("period", float), ("first_periastron_time", float),
+                            ("eccentricity", float), ("major_axis_a", float),
+                            ("observation_deltat", float), ("first_observation_time", float),
+                            ("cadence", float), ("flares_per_day", float), ("lazy", bool)])
 
 class HotJupiterHost(object):
     """Keep the stellar properties in a
@@ -37,16 +51,29 @@ class SyntheticFlares(object):
         number of flares observed per day on average
     poisson_parameter : float
         lambda parameter days^-1
+    rng : Generator or numpy.random
+        random number generator used for all draws,
+        set from the seed argument, see :func:`random_generator`
+    lazy : bool
+        If True, observation times are only represented
+        by observation_grid, and observation_time is None.
+        Memory then scales with the number of flares
+        instead of the number of observations.
+    observation_grid : tuple
+        (start, step, n) of the observation times
 
     """
     def __init__(self, hjhost=HotJupiterHost(), observation_deltat=None,
-                 first_observation_time=0, cadence=None, flares_per_day=None):
+                 first_observation_time=0, cadence=None, flares_per_day=None,
+                 seed=None, lazy=False):
 
         self.hjhost = hjhost
         self.observation_deltat = observation_deltat
         self.first_observation_time = first_observation_time
         self.cadence = cadence
         self.flares_per_day = flares_per_day
+        self.rng = random_generator(seed)
+        self.lazy = lazy
         self.poisson_parameter = 1. / 24. / self.cadence * self.flares_per_day # number of flares per observation time interval
         self.generate_observation_time()
         if self.hjhost.first_periastron_time is None:
@@ -56,20 +83,44 @@ class SyntheticFlares(object):
         """Generate a random first periastron time.
 
         """
-        if self.observation_time.shape[0] == 0:
+        if self.observation_grid[2] == 0:
             raise ValueError("No observations times given."
                              " Try adding observation_deltat >0 to the object.")
-        start, finish = self.observation_time[[0,-1]]
-        random_periastron_time = start  + np.random.rand() * (finish - start)
+        start, finish = self._observation_time_at(np.array([0, -1]))
+        random_periastron_time = start  + self.rng.random() * (finish - start)
         self.hjhost.first_periastron_time = start + (random_periastron_time - start) % self.hjhost.period
 
     def generate_observation_time(self):
         """Generate a series of observation times from
         given start, duration, and cadence.
+        In lazy mode, only the grid is kept.
         """
-        self.observation_time = np.linspace(self.first_observation_time,
-                                        self.first_observation_time + self.observation_deltat,
-                                        int(np.rint(self.observation_deltat * 24 * self.cadence + 1)))
+        n = int(np.rint(self.observation_deltat * 24 * self.cadence + 1))
+        step = self.observation_deltat / (n - 1) if n > 1 else 0.
+        self.observation_grid = (self.first_observation_time, step, n)
+        if self.lazy:
+            self.observation_time = None
+        else:
+            self.observation_time = np.linspace(self.first_observation_time,
+                                            self.first_observation_time + self.observation_deltat,
+                                            n)
+
+    def _observation_time_at(self, idx):
+        """Observation times at given indices,
+        negative indices count from the end.
+        """
+        if self.observation_time is not None:
+            return self.observation_time[idx]
+        start, step, n = self.observation_grid
+        return start + (np.asarray(idx) % n) * step
+
+    def _snap_to_observation_time(self, times):
+        """Indices of the observation times
+        nearest to the given times.
+        """
+        if self.observation_time is not None:
+            return find_nearest(self.observation_time, times, return_index=True)[1]
+        return find_nearest_on_grid(self.observation_grid, times, return_index=True)[1]
 
     def generate_synthetic_flares(self, model="Gauss", **kwargs):
         """Generate synthetic flares and construct a
@@ -90,26 +141,42 @@ class SyntheticFlares(object):
         
     def stack_flares(self):
         """Stack multiple periods onto one another.
-        The flare times are now between 0 and 1, and the 
+        The flare times are now between 0 and 1, with the
+        periastron at 0.5 as in the intensity models, and the
         information about during which period they 
         were observed is lost.
         """
-        self.all_flares["stacked_peak_time"] = (((self.all_flares.peak_time.values - 
-                                                  self.first_observation_time) % 
-                                                 self.hjhost.period) / 
-                                                 self.hjhost.period)
+        self.all_flares["stacked_peak_time"] = (((self.all_flares.peak_time.values -
+                                                  self.hjhost.first_periastron_time) /
+                                                 self.hjhost.period + 0.5) % 1.)
+
+    def exposure(self, n_bins=100):
+        """Observed time per orbital phase bin in orbits,
+        in the frame of the stacked peak times,
+        see :func:`exposure.exposure_from_intervals`.
+        """
+        start, finish = self._observation_time_at(np.array([0, -1]))
+        return exposure_from_intervals([(start, finish)], self.hjhost.period,
+                                       self.hjhost.first_periastron_time, n_bins=n_bins)
 
     def generate_intrinsic_flares(self):
         """Produces a Poisson process generated list
         of flares at random observation times.
+        In lazy mode, the number of flaring observation times
+        is drawn first, and then which ones they are.
         """
-
-        if self.observation_time.shape[0] < self.flares_per_day * self.observation_deltat:
+        n = self.observation_grid[2]
+        if n < self.flares_per_day * self.observation_deltat:
             warn("More flares expected that observation times generated.\n"
                  "Almost all observations will see flares now.")
-        isflares = np.where(np.random.poisson(lam = 1. / 24. / self.cadence * self.flares_per_day,
-                                      size = len(self.observation_time)))[0]
-        self.flare_peak_times = self.observation_time[isflares]
+        if self.lazy:
+            # each observation time sees at least one flare with this probability
+            p_flare = -np.expm1(-self.poisson_parameter)
+            isflares = sample_without_replacement(self.rng, n, self.rng.binomial(n, p_flare))
+        else:
+            isflares = np.where(self.rng.poisson(lam = 1. / 24. / self.cadence * self.flares_per_day,
+                                          size = n))[0]
+        self.flare_peak_times = self._observation_time_at(isflares)
 
 
     def generate_spi_flares(self, model='Gauss', **kwargs):
@@ -126,17 +193,16 @@ class SyntheticFlares(object):
             Keyword arguments to pass to model flare generator.
         """
 
-        models = {"Gauss": self._spi_flares_gauss}
+        models = {"Gauss": self._spi_flares_gauss,
+                  "Intensity": self._spi_flares_intensity}
         if model not in models.keys():
             raise KeyError("This model does not exist.")
         models[model](**kwargs)
 
     def _spi_flares_gauss(self, phase=0.7, width=0.05, size=1):
         """Generates flares from a Gaussian distribution.
-
-        ***
-        Could be faster...
-        ***
+        All clusters are drawn at once and snapped
+        to the nearest observation time.
 
 
         Parameters:
@@ -153,7 +219,7 @@ class SyntheticFlares(object):
                      "phase={}, width={}, and size={}".format(phase, width, size))
             warn(string)
 
-        if size > self.observation_time.shape[0]:
+        if size > self.observation_grid[2]:
             warn("You generate more SPI flares than there are observations.\n"
                  "These are way too many SPI flares.")
 
@@ -162,13 +228,66 @@ class SyntheticFlares(object):
 
         first_mid_cluster = self.hjhost.first_periastron_time + (phase - 0.5) * self.hjhost.period
 
-        spi_flare_times = []
-        t_i = first_mid_cluster
-        while t_i < self.observation_time[-1]:
-            spi_flare_times += list(np.random.normal(loc=t_i, scale=width, size=size))
-            t_i += self.hjhost.period
+        # one cluster per orbit until the end of the observations
+        n_clusters = max(0, int(np.ceil((self._observation_time_at(-1) - first_mid_cluster) / self.hjhost.period)))
+        mid_clusters = first_mid_cluster + self.hjhost.period * np.arange(n_clusters)
+        spi_flare_times = self.rng.normal(loc=mid_clusters[:, np.newaxis], scale=width,
+                                          size=(n_clusters, size)).ravel()
+
+        # snap to the nearest observation time
+        idx = self._snap_to_observation_time(spi_flare_times)
+        self.spi_flare_peak_times = self._observation_time_at(np.unique(idx))
+
+    def _spi_flares_intensity(self, peak, base=0., intensity_model="absolute_distance_influence",
+                              use_major_axis=False, batch_size=1 << 20):
+        """Generates flares from an inhomogeneous Poisson process
+        with one of the intensity models that SPI_Model fits,
+        base + peak * shape(phase), by thinning: candidates are
+        drawn from a homogeneous process at the maximum intensity,
+        which is at the periastron, and accepted with probability
+        intensity / maximum. Candidates are drawn and thinned in
+        batches of whole arrays, and snapped to the nearest
+        observation time.
+
+        Parameters:
+        -----------
+        peak : float
+            peak of the intensity, in flares per day
+        base : float
+            base of the intensity, in flares per day,
+            default 0. for SPI flares only
+        intensity_model : str
+            "absolute_distance_influence" or "inverse_distance_influence"
+        use_major_axis : bool
+            If True, use the model with the host's major axis.
+        batch_size : int
+            maximum number of candidates drawn at once
+        """
+        models = {("absolute_distance_influence", False): model_absolute_distance_influence,
+                  ("inverse_distance_influence", False): model_inverse_distance_influence,
+                  ("absolute_distance_influence", True): model_absolute_distance_influence_with_maj_axis,
+                  ("inverse_distance_influence", True): model_inverse_distance_influence_with_maj_axis}
+        if (intensity_model, use_major_axis) not in models.keys():
+            raise KeyError("This model does not exist.")
+        intensity = models[(intensity_model, use_major_axis)]
+        e, a = self.hjhost.eccentricity, self.hjhost.major_axis_a
+        maximum = intensity(0.5, base, peak, e, a)
 
-        self.spi_flare_peak_times = list(set([find_nearest(self.observation_time, t) for t in spi_flare_times]))
+        start, finish = self._observation_time_at(np.array([0, -1]))
+        n_candidates = self.rng.poisson(maximum * (finish - start))
+        spi_flare_times = []
+        with trusted_evaluation():
+            for i in range(0, n_candidates, batch_size):
+                times = start + self.rng.random(min(batch_size, n_candidates - i)) * (finish - start)
+                phase = ((times - self.hjhost.first_periastron_time) / self.hjhost.period + 0.5) % 1.
+                accept = self.rng.random(times.shape[0]) * maximum < intensity(phase, base, peak, e, a)
+                spi_flare_times.append(times[accept])
+        spi_flare_times = np.concatenate(spi_flare_times + [np.array([])])
+
+        # snap to the nearest observation time, one flare per observation
+        idx = np.sort(self._snap_to_observation_time(spi_flare_times))
+        idx = idx[np.concatenate([[True], np.diff(idx) > 0])[:idx.shape[0]]]
+        self.spi_flare_peak_times = self._observation_time_at(idx)
 
     def merge_spi_and_instrinsic_flares(self):
         """Superimpose intrinsic and SPI flares.
@@ -185,16 +304,17 @@ class SyntheticFlares(object):
                             "peak_time":self.spi_flare_peak_times})
         all_flares = pd.concat([intrinsic, spi])
 
-        # Flag ambiguous flares
-        groups = all_flares.groupby("peak_time").count()
-        for i in groups[groups.source >1].index.values:
-            all_flares.loc[all_flares.peak_time==i, "source"] = "ambiguous"
-        self.all_flares = all_flares.drop_duplicates()
+        # Flag ambiguous flares, and keep the first of each
+        ambiguous = all_flares.peak_time.duplicated(keep=False).values
+        all_flares.loc[ambiguous, "source"] = "ambiguous"
+        self.all_flares = all_flares[~all_flares.peak_time.duplicated(keep="first").values]
 
 
     def write_out_synthetic_flare_table(self, path="synth_flares.csv", **kwargs):
-        """Write the flare table to a .csv file.
-        Not tested.
+        """Write the flare table to a .csv file, or to a
+        binary .npz file if path ends with .npz. The binary
+        file stores the columns as arrays and all host and
+        time series parameters, see :func:`read_synthetic_flare_table`.
 
         Parameters:
         -------------
@@ -203,21 +323,111 @@ class SyntheticFlares(object):
         kwargs : dict
             Keyword arguments to pass to pd.to_csv()
         """
-        self.all_flares.to_csv(path, index=False)
-        with open(path, 'r+') as file:
-            readcontent = file.read()  # store the read value of exe.txt into
-                                        # readcontent
-            file.seek(0, 0) #Takes the cursor to top line
-            header1 = ("#\n# Hot Jupiter host, period [d]\n,{}\n"
-                       "#\n# Hot Jupiter host, T(first periastron)\n,{}"
-                       .format(self.hjhost.period, self.hjhost.first_periastron_time))
-            header2 = ("#\n# Intrinsic flare time series, lambda(Poisson) [d^-1]\n,{}\n"
-                       "#\n# Intrinsic flare time series, start [d], finish [d], cadence [h^-1]\n,{},{},{}"
-                       .format(self.flares_per_day, self.observation_time[0],
-                               self.observation_time[-1], self.cadence))
-            headers = [header1, header2]
-            for header in headers:
-                file.write(header + "\n") #convert int to str since write() deals
-                                           # with str
-            file.write(readcontent) #after content of string are written, I return
-                                     #back content that were in the file
\ No newline at end of file
+        if str(path).endswith(".npz"):
+            self._write_out_npz(path)
+            return
+        header1 = ("#\n# Hot Jupiter host, period [d]\n,{}\n"
+                   "#\n# Hot Jupiter host, T(first periastron)\n,{}"
+                   .format(self.hjhost.period, self.hjhost.first_periastron_time))
+        header2 = ("#\n# Intrinsic flare time series, lambda(Poisson) [d^-1]\n,{}\n"
+                   "#\n# Intrinsic flare time series, start [d], finish [d], cadence [h^-1]\n,{},{},{}"
+                   .format(self.flares_per_day, self._observation_time_at(0),
+                           self._observation_time_at(-1), self.cadence))
+        with open(path, "w", newline="") as file:
+            for header in [header1, header2]:
+                file.write(header + "\n")
+            self.all_flares.to_csv(file, index=False, **kwargs)
+
+    def _write_out_npz(self, path):
+        """Write the flare table and all parameters
+        to an uncompressed binary .npz file.
+        """
+        columns = {"peak_time": self.all_flares.peak_time.values.astype(float),
+                   "source": pd.Categorical(self.all_flares.source.values,
+                                            categories=SOURCES).codes.astype(np.int8)}
+        if "stacked_peak_time" in self.all_flares.columns:
+            columns["stacked_peak_time"] = self.all_flares.stacked_peak_time.values.astype(float)
+        np.savez(path, parameters=self.parameter_record(), **columns)
+
+    def parameter_record(self):
+        """All host and time series parameters
+        as a structured array with one record.
+        """
+        return np.array([(self.hjhost.period, self.hjhost.first_periastron_time,
+                          self.hjhost.eccentricity, self.hjhost.major_axis_a,
+                          self.observation_deltat, self.first_observation_time,
+                          self.cadence, self.flares_per_day, self.lazy)],
+                        dtype=PARAMETER_DTYPE)
+
+
+def synthetic_flares_from_record(parameters, all_flares=None, lazy=None):
+    """Restore a SyntheticFlares object from a parameter
+    record, see :func:`SyntheticFlares.parameter_record`.
+
+    Parameters:
+    -----------
+    parameters : structured array record
+        host and time series parameters
+    all_flares : DataFrame or None
+        flare table of the object
+    lazy : bool or None
+        Observation time mode, None keeps the stored mode
+    """
+    hjhost = HotJupiterHost(e=float(parameters["eccentricity"]), a=float(parameters["major_axis_a"]),
+                            period=float(parameters["period"]),
+                            first_periastron_time=float(parameters["first_periastron_time"]))
+    sf = SyntheticFlares(hjhost=hjhost, observation_deltat=float(parameters["observation_deltat"]),
+                         first_observation_time=float(parameters["first_observation_time"]),
+                         cadence=float(parameters["cadence"]),
+                         flares_per_day=float(parameters["flares_per_day"]),
+                         lazy=bool(parameters["lazy"]) if lazy is None else lazy)
+    if all_flares is not None:
+        sf.all_flares = all_flares
+    return sf
+
+
+def read_synthetic_flare_table(path, lazy=None):
+    """Read a flare table written with
+    :func:`SyntheticFlares.write_out_synthetic_flare_table`
+    back into a SyntheticFlares object with its HotJupiterHost.
+    Eccentricity and major axis are not stored in .csv files
+    and get the HotJupiterHost defaults.
+
+    Parameters:
+    -----------
+    path : str
+        Path to a .npz or .csv file
+    lazy : bool or None
+        Observation time mode of the restored object,
+        None keeps the stored mode (.npz) or uses lazy=False (.csv)
+
+    Return:
+    -------
+    SyntheticFlares
+    """
+    if str(path).endswith(".npz"):
+        with np.load(path) as file:
+            parameters = file["parameters"][0]
+            columns = {"source": np.asarray(SOURCES, dtype=object)[file["source"]],
+                       "peak_time": file["peak_time"]}
+            if "stacked_peak_time" in file.files:
+                columns["stacked_peak_time"] = file["stacked_peak_time"]
+        return synthetic_flares_from_record(parameters, pd.DataFrame(columns), lazy=lazy)
+
+    values, n_header = [], 0
+    with open(path, "r") as file:
+        for line in file:
+            if line.startswith("#"):
+                n_header += 1
+            elif line.startswith(","):
+                n_header += 1
+                values.append([float(v) for v in line.strip().split(",")[1:]])
+            else:
+                break
+    (period,), (first_periastron_time,), (flares_per_day,), (start, finish, cadence) = values
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=period, first_periastron_time=first_periastron_time),
+                         observation_deltat=finish - start, first_observation_time=start,
+                         cadence=cadence, flares_per_day=flares_per_day,
+                         lazy=False if lazy is None else lazy)
+    sf.all_flares = pd.read_csv(path, skiprows=n_header, float_precision="round_trip")
+    return sf
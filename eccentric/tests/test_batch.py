@@ -0,0 +1,48 @@
+import pytest
+import numpy as np
+
+from ..batch import fit_batch, pad_ragged
+from ..spimodel import SPI_Model
+
+def test_pad_ragged():
+    data = [np.array([.1, .2]), np.array([]), np.array([.3])]
+    padded = pad_ragged(data)
+    assert padded.shape == (3, 2)
+    assert np.isnan(padded[1]).all()
+    assert padded[2, 0] == .3
+    # offsets encoded input gives the same result
+    offset_padded = pad_ragged(np.array([.1, .2, .3]), offsets=[0, 2, 2, 3])
+    assert np.array_equal(padded, offset_padded, equal_nan=True)
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_fit_batch():
+    np.random.seed(42)
+    data = [np.random.rand(50),
+            np.concatenate([np.random.rand(30), np.random.normal(.5, .05, 20) % 1]),
+            np.linspace(0, 1, 10)]
+    eccentricity, n_orbits = [.5, .3, .5], [5, 10, 1]
+    for model in ['absolute_distance_influence', 'inverse_distance_influence']:
+        for major_axis_a in [None, 1.5]:
+            output, likelihood = fit_batch(data, eccentricity, n_orbits, model=model,
+                                           major_axis_a=major_axis_a, return_likelihood=True)
+            assert output.shape == (3, 2)
+            assert (output >= 0).all()
+            for i in range(3):
+                pm = SPI_Model(major_axis_a=major_axis_a, eccentricity=eccentricity[i],
+                               data=data[i], model=model, n_orbits=n_orbits[i])
+                single = pm.estimate_two_parameters()
+                # batch fit is at least as good as the single fit
+                assert likelihood[i] <= pm._negative_likelihood_function(single) + 1e-8
+                assert likelihood[i] == pytest.approx(pm._negative_likelihood_function(output[i]))
+
+def test_fit_batch_edge_cases():
+    # empty data sets have no flares at all
+    output = fit_batch([np.array([]), np.array([.2, .5])], .5, 1)
+    assert output[0] == pytest.approx([0, 0])
+    # a circular orbit has no peak in the absolute distance model
+    output = fit_batch([np.random.rand(20)], 0., 2)
+    assert output[0] == pytest.approx([10, 0])
+    with pytest.raises(KeyError):
+        fit_batch([np.random.rand(20)], 1.5, 2)
+    with pytest.raises(KeyError):
+        fit_batch([np.random.rand(20)], .5, 2, model="default")
@@ -0,0 +1,88 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+
+from .. import cache as cache_module
+from ..cache import FitCache, fit_key, code_version
+from ..spimodel import SPI_Model
+from ..sweep import make_grid, run_sweep
+
+def test_fit_key():
+    data = np.random.rand(100)
+    key = fit_key(data, model="a", eccentricity=.5, exposure=None)
+    assert key == fit_key(data.copy(), eccentricity=np.float64(.5), model="a", exposure=None)
+    assert key == fit_key([data[:30], data[30:]], model="a", eccentricity=.5, exposure=None, chunk_size=7)
+    assert key != fit_key(data, model="a", eccentricity=.6, exposure=None)
+    assert key != fit_key(data[:-1], model="a", eccentricity=.5, exposure=None)
+    assert key != fit_key(data, model="a", eccentricity=.5, exposure=np.ones(10))
+
+def test_fit_key_code_version(monkeypatch):
+    data = np.random.rand(100)
+    key, version = fit_key(data, model="a"), code_version()
+    assert cache_module.CODE_VERSION == version
+    # keys change with the code of the fits
+    monkeypatch.setattr(cache_module, "CODE_VERSION", version + "edited")
+    assert fit_key(data, model="a") != key
+    # and the code version with the source of the fit modules
+    monkeypatch.setattr(cache_module, "FIT_MODULES", ("models.py",))
+    assert code_version() != version
+
+def test_fit_cache(tmp_path):
+    cache = FitCache(tmp_path / "cache", max_entries=3)
+    assert cache.get("missing") is None
+    for i in range(3):
+        cache.put("key{}".format(i), [i, 2. * i])
+        os.utime(cache._file("key{}".format(i)), (i, i))
+    assert cache.get("key1") == pytest.approx([1., 2.])
+    # key0 and key2 are the least recently used,
+    # the cache is trimmed to max_entries - batch
+    cache.put("key3", [3., 6.])
+    assert len(cache) == 2
+    assert cache.get("key0") is None and cache.get("key2") is None
+    assert cache.get("key1") is not None
+    assert not [f for f in os.listdir(cache.path) if f.endswith(".tmp")]
+    cache.clear()
+    assert len(cache) == 0
+
+def test_fit_cache_batched_eviction(tmp_path, monkeypatch):
+    cache = FitCache(tmp_path, max_entries=100)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+    for i in range(250):
+        cache.put("key{}".format(i), [i])
+        assert len(entries()) <= 110
+    # the directory is only scanned every max_entries // 10 writes
+    assert len(scans) == 25
+    assert cache.get("key249") is not None
+
+def test_spi_model_cache(tmp_path, monkeypatch):
+    np.random.seed(2)
+    data = np.concatenate([np.random.rand(300), np.random.normal(.5, .05, 100) % 1])
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = .5, data = data, n_orbits = 10, cache = tmp_path)
+    expected = pm.estimate_two_parameters()
+    assert len(FitCache(tmp_path)) == 1
+
+    # a new model on the same data does not fit again
+    from .. import spimodel
+    def fail(*args, **kwargs):
+        raise AssertionError("fitted instead of using the cache")
+    monkeypatch.setattr(spimodel, "minimize", fail)
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = .5, data = data.copy(), n_orbits = 10,
+                   cache = FitCache(tmp_path))
+    assert pm.estimate_two_parameters() == pytest.approx(expected)
+    pm.eccentricity = .6
+    with pytest.raises(AssertionError):
+        pm.estimate_two_parameters()
+
+def test_sweep_cache(tmp_path):
+    grid = make_grid(period=[5], eccentricity=[.3], phase=[.5], width=[.02],
+                     size=[3], flares_per_day=[.5], n_realizations=3)
+    cache = tmp_path / "cache"
+    first, second = tmp_path / "first.csv", tmp_path / "second.csv"
+    run_sweep(grid, path=first, observation_deltat=30, seed=7, max_workers=2, cache=cache)
+    assert len(FitCache(cache)) == 3
+    # a restarted sweep gives the same results from the cache
+    run_sweep(grid, path=second, observation_deltat=30, seed=7, max_workers=1, cache=cache)
+    pd.testing.assert_frame_equal(pd.read_csv(first), pd.read_csv(second))
@@ -0,0 +1,60 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from ..campaign import CampaignWriter, CampaignReader, merge_shards, shard_path
+from ..synthetic import SyntheticFlares, HotJupiterHost
+from ..sweep import make_grid, run_sweep
+
+def realization(seed, size=3):
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=2, e=.3, a=.5),
+                         observation_deltat=10, cadence=2, flares_per_day=1, seed=seed)
+    sf.generate_synthetic_flares(phase=0.5, size=size, width=0.1)
+    return sf
+
+def test_write_and_read_campaign(tmp_path):
+    path = tmp_path / "campaign.bin"
+    realizations = [realization(seed, size) for seed, size in zip(range(4), [3, 0, 5, 2])]
+    with CampaignWriter(path, mode="w") as writer:
+        for sf in realizations[:2]:
+            writer.append(sf)
+    # appending continues the index
+    with CampaignWriter(path) as writer:
+        for sf in realizations[2:]:
+            writer.append(sf)
+
+    reader = CampaignReader(path)
+    assert len(reader) == 4
+    assert (reader.index["realization"] == np.arange(4)).all()
+    assert isinstance(reader.flares, np.memmap)
+    for k, (entry, records) in enumerate(reader):
+        sf = realizations[k]
+        assert (records["peak_time"] == sf.all_flares.peak_time.values).all()
+        assert entry["period"] == 2 and entry["eccentricity"] == .3
+    restored = reader.synthetic_flares(2)
+    pd.testing.assert_frame_equal(restored.all_flares, realizations[2].all_flares.reset_index(drop=True),
+                                  check_dtype=False)
+    assert restored.hjhost.first_periastron_time == realizations[2].hjhost.first_periastron_time
+
+def test_merge_shards(tmp_path):
+    path = tmp_path / "campaign.bin"
+    shards = [shard_path(path, i) for i in range(3)]
+    for i, shard in enumerate(shards):
+        with CampaignWriter(shard, mode="w") as writer:
+            for j in range(2):
+                writer.append(realization(10 * i + j), realization=10 * i + j)
+    merge_shards(path, shards)
+    reader = CampaignReader(path)
+    assert list(reader.index["realization"]) == [0, 1, 10, 11, 20, 21]
+    assert (reader[3]["peak_time"] == realization(11).all_flares.peak_time.values).all()
+    assert reader.index["count"].sum() == reader.flares.shape[0]
+
+def test_run_sweep_with_campaign(tmp_path):
+    grid = make_grid(period=[5], eccentricity=[.3], phase=[.5], width=[.02],
+                     size=[3], flares_per_day=[.5], n_realizations=3)
+    run_sweep(grid, path=tmp_path / "sweep.csv", observation_deltat=30, max_workers=2,
+              campaign=tmp_path / "campaign.bin")
+    results = pd.read_csv(tmp_path / "sweep.csv")
+    reader = CampaignReader(tmp_path / "campaign.bin")
+    assert list(reader.index["realization"]) == list(results.task)
+    assert list(reader.index["count"]) == list(results.n_flares)
@@ -0,0 +1,71 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+
+from ..catalog import read_catalog, star_from_filename, observing_time, FlareCatalog, KEPLER_SHORT_CADENCE
+from ..spimodel import SPI_Model
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "..", "data")
+
+def test_star_from_filename():
+    assert star_from_filename("data/2019_11_05_KOI12_flares_full_sample.csv") == "KOI12"
+    assert star_from_filename("2019_11_06_Kepler42_flare_full_sample.csv") == "Kepler42"
+    with pytest.raises(ValueError):
+        star_from_filename("synth/000_eccentric_hjhost_with_flares.csv")
+
+def test_read_catalog():
+    catalog = read_catalog(DATA, min_c=None)
+    assert len(catalog.stars) == 9
+    assert catalog.offsets[-1] == catalog.flares.shape[0]
+    koi12 = pd.read_csv(os.path.join(DATA, "2019_11_05_KOI12_flares_full_sample.csv"))
+    assert (catalog.star("KOI12").tstart.values == np.sort(koi12.tstart.values)).all()
+    # only flares with c > -.5 by default
+    catalog = read_catalog(DATA)
+    assert (catalog.flares.c > -.5).all()
+    assert catalog.star("KOI12").shape[0] == (koi12.c > -.5).sum()
+    with pytest.raises(KeyError):
+        catalog.star("Sun")
+
+def test_fold_and_fit():
+    flares = pd.DataFrame({"star": ["a", "a", "b", "b", "b", "c"],
+                           "tstart": [1., 3., 10., 10.5, 11., 0.],
+                           "tstop": [1.1, 3.1, 10.1, 10.6, 11.1, .1],
+                           "c": 0, "total_n_valid_data_points": [np.nan, np.nan, 100, 100, 60, 10]})
+    systems = pd.DataFrame({"period": [2., 1.], "eccentricity": [.3, .5],
+                            "periastron": [0., 10.], "n_orbits": [5., np.nan]},
+                           index=pd.Index(["a", "b"], name="star"))
+    catalog = FlareCatalog(flares, systems=systems, cadence=.01)
+    phases = catalog.fold()
+    assert phases[:5] == pytest.approx([0., 0., .5, 0., .5])
+    assert np.isnan(phases[5])
+    assert catalog.n_orbits()[:2] == pytest.approx([5., 1.6])
+    assert np.isnan(catalog.n_orbits()[2])
+
+    fit = catalog.fit()
+    assert list(fit.index) == ["a", "b"]
+    pm = SPI_Model(eccentricity = .5, data = phases[2:5], n_orbits = 1.6)
+    assert fit.loc["b", ["base", "peak"]].values == pytest.approx(pm.estimate_two_parameters(), rel=1e-3)
+
+def test_n_orbits_from_valid_data_points():
+    catalog = read_catalog(DATA, min_c=None)
+    kepler1656 = pd.read_csv(os.path.join(DATA, "2019_11_06_Kepler1656_flares_full_sample.csv"))
+    expected = kepler1656.total_n_valid_data_points.unique().sum() * KEPLER_SHORT_CADENCE
+    assert catalog.observed_time["Kepler1656"] == pytest.approx(expected)
+    # light curves count even if all their flares are dropped
+    assert (read_catalog(DATA).observed_time == catalog.observed_time).all()
+
+    flares = pd.DataFrame({"star": ["a"], "tstart": [1.], "tstop": [1.1], "c": 0})
+    systems = pd.DataFrame({"period": [2.], "eccentricity": [.3], "periastron": [0.]},
+                           index=pd.Index(["a"], name="star"))
+    with pytest.raises(ValueError):
+        FlareCatalog(flares, systems=systems).n_orbits()
+
+def test_observing_time_equal_counts():
+    # two quarters of star a with the same number of valid data points
+    flares = pd.DataFrame({"star": ["a", "a", "a", "b"], "quarter": [1, 1, 2, 1],
+                           "total_n_valid_data_points": [100, 100, 100, 50]})
+    assert observing_time(flares, cadence=.01).to_dict() == pytest.approx({"a": 2., "b": .5})
+    # without a light curve column, equal counts are merged
+    flares = flares.drop(columns="quarter")
+    assert observing_time(flares, cadence=.01).to_dict() == pytest.approx({"a": 1., "b": .5})
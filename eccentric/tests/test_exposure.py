@@ -0,0 +1,62 @@
+import pytest
+import numpy as np
+from scipy.integrate import quad
+
+from ..exposure import exposure_from_intervals, exposure_from_cadence, exposure_compensator
+from ..models import shape_inverse_distance_influence, shape_integral
+from ..spimodel import SPI_Model
+from ..synthetic import SyntheticFlares, HotJupiterHost
+
+def test_exposure_from_intervals():
+    # three full orbits cover all bins evenly
+    exposure = exposure_from_intervals([(2., 8.)], period=2., periastron=1., n_bins=10)
+    assert exposure == pytest.approx(np.full(10, .3))
+    # half an orbit from periastron covers phases 0.5 to 1
+    exposure = exposure_from_intervals([[1., 2.], [5., 6.]], period=2., periastron=1., n_bins=4)
+    assert exposure == pytest.approx([0., 0., .5, .5])
+    assert exposure_from_intervals(np.empty((0, 2)), 2., 1.).sum() == 0.
+
+def test_exposure_from_cadence():
+    times = np.arange(0, 20, .01)
+    valid = (times < 5) | (times > 12)
+    intervals = [(0., 5.), (12., 20.)]
+    cadence = exposure_from_cadence(times, 3., .7, .01, valid=valid, n_bins=20)
+    assert cadence == pytest.approx(exposure_from_intervals(intervals, 3., .7, n_bins=20), abs=.01)
+
+def test_exposure_compensator():
+    shape = shape_inverse_distance_influence
+    # full coverage gives the usual compensator
+    compensator = exposure_compensator(shape, .6, np.full(50, 4. / 50))
+    assert compensator == pytest.approx([4., 4. * shape_integral(shape, .6)])
+    # gaps: compare to the integral over the observed time
+    intervals, period, periastron = [(0., 3.3), (7.1, 9.)], 1.7, .4
+    exposure = exposure_from_intervals(intervals, period, periastron, n_bins=1000)
+    phase = lambda t: ((t - periastron) / period + .5) % 1.
+    expected = sum(quad(lambda t: shape(phase(t), .6), start, stop, limit=200)[0]
+                   for start, stop in intervals) / period
+    compensator = exposure_compensator(shape, .6, exposure)
+    assert compensator[0] == pytest.approx((3.3 + 1.9) / period)
+    assert compensator[1] == pytest.approx(expected, rel=1e-3)
+
+def test_spi_model_with_exposure():
+    rng = np.random.default_rng(3)
+    data = np.concatenate([rng.random(200), rng.normal(.5, .05, 50) % 1])
+    exposure = np.full(100, 10. / 100)
+    uniform = SPI_Model(major_axis_a=1.5, eccentricity=.5, data=data, n_orbits=10,
+                        model='inverse_distance_influence')
+    exposed = SPI_Model(major_axis_a=1.5, eccentricity=.5, data=data, exposure=exposure,
+                        model='inverse_distance_influence')
+    assert exposed.estimate_two_parameters() == pytest.approx(uniform.estimate_two_parameters(), rel=1e-4)
+    # half the phases unobserved: the same events imply a higher rate
+    exposure[:50] = 0.
+    exposed.exposure = exposure.copy()
+    assert exposed.estimate_two_parameters()[0] > uniform.estimate_two_parameters()[0]
+    log_likelihood, params = exposed.profile_likelihood([.5], phase_shifts=[0., .1])
+    assert params[0, 0] == pytest.approx(exposed.estimate_two_parameters(), rel=1e-3)
+
+def test_synthetic_flares_exposure():
+    sf = SyntheticFlares(hjhost=HotJupiterHost(e=.3, period=4., first_periastron_time=1.),
+                         observation_deltat=40, cadence=2, flares_per_day=.1, seed=1)
+    exposure = sf.exposure(n_bins=8)
+    assert exposure.sum() == pytest.approx(10.)
+    assert exposure == pytest.approx(np.full(8, 10. / 8))
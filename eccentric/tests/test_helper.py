@@ -0,0 +1,36 @@
+import pytest
+import numpy as np
+
+from ..helper import find_nearest, find_nearest_on_grid, sample_without_replacement
+
+def test_find_nearest():
+    array = np.arange(5.)
+    # scalar input gives scalar output, ties go to the larger entry
+    assert find_nearest(array, 1.5) == 2.
+    assert find_nearest(array, 1.4) == 1.
+    assert find_nearest(array, -3) == 0.
+    assert find_nearest(array, 10) == 4.
+    # array input is matched element-wise
+    values = np.array([-1, 1.4, 1.5, 1.6, 3, 9])
+    nearest, idx = find_nearest(array, values, return_index=True)
+    assert (nearest == [0, 1, 2, 2, 3, 4]).all()
+    assert (array[idx] == nearest).all()
+    # a single observation time takes all values
+    assert (find_nearest(np.array([7.]), values) == 7.).all()
+
+def test_find_nearest_on_grid():
+    grid = (1., .5, 9)
+    array = 1. + .5 * np.arange(9)
+    values = np.array([-3, 1.2, 1.25, 2.3, 4.9, 10.])
+    nearest, idx = find_nearest_on_grid(grid, values, return_index=True)
+    assert nearest == pytest.approx(find_nearest(array, values))
+    assert (idx == find_nearest(array, values, return_index=True)[1]).all()
+    assert find_nearest_on_grid((1., 0., 1), 3.) == 1.
+
+def test_sample_without_replacement():
+    rng = np.random.default_rng(1)
+    idx = sample_without_replacement(rng, 10**12, 1000)
+    assert idx.shape[0] == 1000
+    assert (np.diff(idx) > 0).all()
+    assert (idx >= 0).all() and (idx < 10**12).all()
+    assert (sample_without_replacement(rng, 5, 5) == np.arange(5)).all()
@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+
+from ..joint import JointSPI_Model
+from ..spimodel import SPI_Model
+
+def star_models(seed=0):
+    rng = np.random.default_rng(seed)
+    models = []
+    for eccentricity, n_orbits, n_background, n_spi in [(.3, 10, 100, 40), (.6, 20, 300, 60), (.8, 5, 30, 15)]:
+        data = np.concatenate([rng.random(n_background), rng.normal(.5, .05, n_spi) % 1])
+        models.append(SPI_Model(major_axis_a = 1.5, eccentricity = eccentricity, data = data,
+                                model = 'inverse_distance_influence', n_orbits = n_orbits))
+    return models
+
+def test_joint_single_star():
+    model = star_models()[1]
+    base, peak = model.estimate_two_parameters()
+    for shared in ["peak", "ratio"]:
+        joint = JointSPI_Model([model], shared = shared)
+        bases, shared_parameter = joint.estimate_parameters()
+        assert bases[0] == pytest.approx(base, rel=1e-3)
+        expected = peak if shared == "peak" else peak / base
+        assert shared_parameter == pytest.approx(expected, rel=1e-3)
+
+def test_joint_gradient_and_hessian():
+    for shared in ["peak", "ratio"]:
+        joint = JointSPI_Model(star_models(), shared = shared)
+        parameters = np.array([10., 15., 6., 2.])
+        _, gradient = joint._negative_likelihood_function(parameters)
+        hessian = joint._negative_likelihood_hessian(parameters)
+        epsilon = 1e-6
+        for i, step in enumerate(np.eye(4) * epsilon):
+            up, gradient_up = joint._negative_likelihood_function(parameters + step)
+            down, gradient_down = joint._negative_likelihood_function(parameters - step)
+            assert gradient[i] == pytest.approx((up - down) / (2 * epsilon), rel=1e-5)
+            assert hessian[i] == pytest.approx((gradient_up - gradient_down) / (2 * epsilon), rel=1e-4, abs=1e-6)
+
+def test_joint_estimate_parameters():
+    models = star_models()
+    joint = JointSPI_Model(models)
+    bases, peak = joint.estimate_parameters()
+    assert bases.shape == (3,)
+    assert peak > 0
+    # the joint fit is at least as good as any common peak
+    value, _ = joint._negative_likelihood_function(np.append(bases, peak))
+    for other in [0., peak / 2, 2 * peak]:
+        other_bases = [m.estimate_two_parameters()[0] for m in models]
+        assert value <= joint._negative_likelihood_function(np.append(other_bases, other))[0]
+    base_errors, peak_error = joint.standard_errors()
+    assert (base_errors > 0).all() and peak_error > 0
+    with pytest.raises(KeyError):
+        JointSPI_Model(models, shared = "base")
@@ -0,0 +1,82 @@
+import pytest
+import numpy as np
+
+from ..likelihood import CompiledModel, ChunkedModel, BinnedModel, bin_phases
+from ..models import (model_inverse_distance_influence_with_maj_axis,
+                      shape_inverse_distance_influence_with_maj_axis)
+
+def test_compiled_model():
+    data = np.linspace(0, 1, 10)
+    compiled = CompiledModel(data, shape_inverse_distance_influence_with_maj_axis, .5, 1.5, n_orbits=3)
+    assert compiled.shape.shape == (10,)
+    assert compiled.compensator == pytest.approx([3, 3 * compiled.integral])
+    intensity = model_inverse_distance_influence_with_maj_axis(data, 1., 2., .5, 1.5)
+    assert compiled.intensity([1., 2.]) == pytest.approx(intensity)
+    expected = -np.log(intensity).sum() + 3 * (1. + 2. * compiled.integral)
+    assert compiled.negative_log_likelihood([1., 2.]) == pytest.approx(expected)
+    assert compiled.gradient([1., 2.]).shape == (2,)
+    assert compiled.hessian([1., 2.]).shape == (2, 2)
+
+    # parameters are validated as in the models
+    with pytest.raises(KeyError):
+        compiled.negative_log_likelihood([-1., 2.])
+    with pytest.raises(KeyError):
+        compiled.negative_log_likelihood([1., -2.])
+    with pytest.raises(ValueError):
+        compiled.negative_log_likelihood([1., np.inf])
+    with pytest.raises(KeyError):
+        CompiledModel(data, shape_inverse_distance_influence_with_maj_axis, 1.5, 1.5)
+
+def test_chunked_model(tmp_path):
+    data = np.random.rand(1000)
+    compiled = CompiledModel(data, shape_inverse_distance_influence_with_maj_axis, .5, 1.5, n_orbits=3)
+    memmap = np.memmap(tmp_path / "phases.bin", dtype=float, mode="w+", shape=data.shape)
+    memmap[:] = data
+    for chunked_data in [data, memmap, [data[:300], data[300:]]]:
+        chunked = ChunkedModel(chunked_data, shape_inverse_distance_influence_with_maj_axis, .5, 1.5,
+                               n_orbits=3, chunk_size=128)
+        assert chunked.n_events == 1000
+        assert max(len(chunk) for chunk in chunked.chunks()) == 128
+        for method in ["negative_log_likelihood", "gradient", "hessian", "intensity"]:
+            assert getattr(chunked, method)([1., 2.]) == pytest.approx(getattr(compiled, method)([1., 2.]))
+    with pytest.raises(TypeError):
+        ChunkedModel(iter([data]), shape_inverse_distance_influence_with_maj_axis, .5, 1.5)
+
+def test_bin_phases():
+    data = np.array([0., .1, .24, .25, .99, 1., 1.3])
+    assert bin_phases(data, 4) == pytest.approx([4, 2, 0, 1])
+    assert bin_phases([data[:3], data[3:]], 4, chunk_size=2) == pytest.approx([4, 2, 0, 1])
+
+def test_binned_model():
+    data = np.random.rand(1000)
+    compiled = CompiledModel(data, shape_inverse_distance_influence_with_maj_axis, .5, 1.5, n_orbits=3)
+    binned = BinnedModel(data, shape_inverse_distance_influence_with_maj_axis, .5, 1.5, n_orbits=3, n_bins=20)
+    assert binned.weights.sum() == 1000
+    assert binned.compensator == pytest.approx(compiled.compensator)
+    assert (binned.shape * binned.weights).sum() == pytest.approx(compiled.shape.sum(), rel=1e-2)
+    # narrow bins approach the unbinned likelihood
+    fine = BinnedModel(data, shape_inverse_distance_influence_with_maj_axis, .5, 1.5, n_orbits=3, n_bins=5000)
+    assert fine.negative_log_likelihood([1., 2.]) == pytest.approx(compiled.negative_log_likelihood([1., 2.]),
+                                                                   rel=1e-4)
+    assert fine.gradient([1., 2.]) == pytest.approx(compiled.gradient([1., 2.]), rel=1e-3)
+
+def test_append():
+    data = np.random.rand(1000)
+    shape = shape_inverse_distance_influence_with_maj_axis
+    full = CompiledModel(data, shape, .5, 1.5, n_orbits=5)
+    for model in [CompiledModel(data[:10], shape, .5, 1.5, n_orbits=1),
+                  ChunkedModel(data[:10], shape, .5, 1.5, n_orbits=1, chunk_size=64)]:
+        for start, stop in [(10, 400), (400, 401), (401, 1000)]:
+            model.append(data[start:stop], n_orbits=4 / 3)
+        for method in ["negative_log_likelihood", "gradient", "hessian", "intensity"]:
+            assert getattr(model, method)([1., 2.]) == pytest.approx(getattr(full, method)([1., 2.]))
+    binned = BinnedModel(data[:500], shape, .5, 1.5, n_orbits=2, n_bins=50)
+    binned.append(data[500:], n_orbits=3)
+    assert binned.weights == pytest.approx(BinnedModel(data, shape, .5, 1.5, n_orbits=5, n_bins=50).weights)
+    assert binned.compensator == pytest.approx(full.compensator)
+    # uniform orbits and exposure histograms add up
+    model = CompiledModel(data, shape, .5, 1.5, n_orbits=2)
+    model.append([], exposure=np.full(10, .3))
+    model.append([], n_orbits=1)
+    assert model.exposure == pytest.approx(np.full(10, .6))
+    assert model.compensator == pytest.approx(full.compensator * 6 / 5)
@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+
+from ..mcmc import LogPosterior, run_ensemble, sample_posterior
+from ..spimodel import SPI_Model
+
+def spi_model(seed=0, **kwargs):
+    rng = np.random.default_rng(seed)
+    data = np.concatenate([rng.random(300), rng.normal(.5, .05, 100) % 1])
+    return SPI_Model(major_axis_a = 1.5, eccentricity = .5, data = data, n_orbits = 10,
+                     model = 'inverse_distance_influence', **kwargs)
+
+def test_log_posterior():
+    pm = spi_model()
+    walkers = np.array([[20., 10.], [30., 5.], [-1., 5.], [30., -1.]])
+    log_probability = LogPosterior(pm)(walkers)
+    assert log_probability[:2] == pytest.approx([-pm._negative_likelihood_function(w) for w in walkers[:2]])
+    assert (log_probability[2:] == -np.inf).all()
+    # eccentricity as a parameter, compensator interpolated
+    log_probability_e = LogPosterior(pm, sample_eccentricity=True)(np.array([[20., 10., .5], [20., 10., 1.2]]))
+    assert log_probability_e[0] == pytest.approx(log_probability[0], rel=1e-4)
+    assert log_probability_e[1] == -np.inf
+    # binned data use the mean shape per bin at each eccentricity
+    binned = spi_model(n_bins=50)
+    log_probability_e = LogPosterior(binned, sample_eccentricity=True)(np.array([[20., 10., .5], [20., 10., .7]]))
+    expected = []
+    for eccentricity in [.5, .7]:
+        binned.eccentricity = eccentricity
+        expected.append(-binned._negative_likelihood_function([20., 10.]))
+    assert log_probability_e == pytest.approx(expected, rel=1e-6)
+
+def test_run_ensemble():
+    # standard normal in two dimensions
+    log_probability = lambda walkers: -.5 * (walkers**2).sum(axis=1)
+    start = np.random.default_rng(1).normal(size=(20, 2))
+    chain, acceptance = run_ensemble(log_probability, start, 2000, seed=2)
+    assert chain.shape == (2000, 20, 2)
+    assert 0.3 < acceptance < 0.9
+    samples = chain[500:].reshape(-1, 2)
+    assert samples.mean(axis=0) == pytest.approx([0, 0], abs=.1)
+    assert samples.std(axis=0) == pytest.approx([1, 1], rel=.1)
+
+def test_sample_posterior():
+    pm = spi_model()
+    chains, acceptance = sample_posterior(pm, n_walkers=16, n_steps=1500, seed=3, max_workers=1)
+    assert chains.shape == (1, 1500, 16, 2)
+    assert (chains >= 0).all()
+    samples = chains[0, 500:].reshape(-1, 2)
+    errors = pm.standard_errors()
+    assert samples.mean(axis=0) == pytest.approx(pm.MLE_params, abs=errors.max())
+    assert samples.std(axis=0) == pytest.approx(errors, rel=.3)
+
+    # chains on a process pool give the same draws as in serial
+    serial, _ = sample_posterior(pm, n_walkers=8, n_steps=50, n_chains=2, seed=4, max_workers=1)
+    pooled, _ = sample_posterior(pm, n_walkers=8, n_steps=50, n_chains=2, seed=4, max_workers=2)
+    assert (serial == pooled).all()
+    assert not (serial[0] == serial[1]).all()
+
+    chains, _ = sample_posterior(spi_model(n_bins=200), n_walkers=8, n_steps=50, sample_eccentricity=True,
+                                 seed=5, max_workers=1)
+    assert chains.shape == (1, 50, 8, 3)
+    assert ((chains[..., 2] >= 0) & (chains[..., 2] <= 1)).all()
+    with pytest.raises(ValueError):
+        sample_posterior(pm, n_walkers=4, sample_eccentricity=True)
@@ -1,4 +1,5 @@
 import pytest
+import threading
 import numpy as np
 
 from ..models import *
@@ -68,3 +69,65 @@ def test_model_inverse_distance_influence_with_maj_axis():
     
     
 
+
+
+def test_shape_integral():
+    # a circular orbit has constant distance, so the absolute distance term vanishes
+    assert shape_integral(shape_absolute_distance_influence, 0.) == pytest.approx(0.)
+    assert shape_integral(shape_inverse_distance_influence, 0.) == pytest.approx(0.5)
+    # results are cached per shape and orbit
+    shape_integral.cache_clear()
+    shape_integral(shape_inverse_distance_influence_with_maj_axis, 0.3, 1.5)
+    shape_integral(shape_inverse_distance_influence_with_maj_axis, 0.3, 1.5)
+    assert shape_integral.cache_info().hits == 1
+    # the model is base + peak * shape
+    time, base, peak, eccentricity, major_axis_a = [0.3,2,3,0.7,1.5]
+    assert (model_inverse_distance_influence_with_maj_axis(time, base, peak, eccentricity, major_axis_a) ==
+            pytest.approx(base + peak*shape_inverse_distance_influence_with_maj_axis(time, eccentricity, major_axis_a)))
+
+
+def test_ContainsNaN_evaluates_once():
+    calls = []
+    @ContainsNaN
+    def model(time):
+        calls.append(time)
+        return time
+    assert model(1.) == 1.
+    assert len(calls) == 1
+    with pytest.raises(ValueError):
+        model(np.array([1., np.inf]))
+    with pytest.raises(ValueError):
+        model(np.array([1., np.nan]))
+    # trusted mode skips the checks
+    with trusted_evaluation():
+        assert np.isinf(model(np.inf))
+    with pytest.raises(ValueError):
+        model(np.inf)
+    assert np.isinf(model.__wrapped__(np.inf))
+    # other threads keep checking
+    errors = []
+    def evaluate():
+        try:
+            model(np.inf)
+        except ValueError as error:
+            errors.append(error)
+    with trusted_evaluation():
+        thread = threading.Thread(target=evaluate)
+        thread.start()
+        thread.join()
+    assert len(errors) == 1
+
+def test_gradient_models():
+    time = np.linspace(0, 1, 11)
+    pairs = [(model_absolute_distance_influence, gradient_model_absolute_distance_influence),
+             (model_inverse_distance_influence, gradient_model_inverse_distance_influence),
+             (model_absolute_distance_influence_with_maj_axis, gradient_model_absolute_distance_influence_with_maj_axis),
+             (model_inverse_distance_influence_with_maj_axis, gradient_model_inverse_distance_influence_with_maj_axis)]
+    base, peak, epsilon = 1.5, 2., 1e-6
+    for model, gradient in pairs:
+        analytic = gradient(time, base, peak, .4, 1.3)
+        assert analytic.shape == (2, 11)
+        d_base = (model(time, base + epsilon, peak, .4, 1.3) - model(time, base - epsilon, peak, .4, 1.3)) / (2 * epsilon)
+        d_peak = (model(time, base, peak + epsilon, .4, 1.3) - model(time, base, peak - epsilon, .4, 1.3)) / (2 * epsilon)
+        assert analytic[0] == pytest.approx(d_base, rel=1e-6)
+        assert analytic[1] == pytest.approx(d_peak, rel=1e-6, abs=1e-9)
@@ -0,0 +1,86 @@
+import pytest
+import numpy as np
+
+from ..spimodel import SPI_Model
+from ..models import shape_inverse_distance_influence, shape_bin_integrals
+from ..likelihood import bin_phases, orbit_compensator
+from ..significance import (homogeneous_negative_log_likelihood, likelihood_ratio_statistic,
+                            simulate_null_statistics, likelihood_ratio_test)
+
+def test_homogeneous_negative_log_likelihood():
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = np.random.rand(20), n_orbits = 4)
+    assert homogeneous_negative_log_likelihood(20, 4) == pytest.approx(pm._negative_likelihood_function([5., 0.]))
+    assert homogeneous_negative_log_likelihood(0, 4) == 0.
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_likelihood_ratio_test():
+    np.random.seed(1)
+    clustered = np.concatenate([np.random.rand(40), np.random.normal(.5, .03, 40) % 1])
+    pm = SPI_Model(major_axis_a = 2., eccentricity = 0.7, data = clustered,
+                   model = 'inverse_distance_influence', n_orbits = 10)
+    statistic, p_value, simulated = likelihood_ratio_test(pm, n_simulations = 1000, precision = .01,
+                                                          batch_size = 100, max_workers = 1, seed = 2)
+    assert statistic > 0
+    assert p_value < .01
+    # stops early once the p-value is resolved
+    assert simulated < 1000
+
+    pm.data = np.random.rand(80)
+    serial = likelihood_ratio_test(pm, n_simulations = 400, precision = 0., batch_size = 100,
+                                   max_workers = 1, seed = 2)
+    pooled = likelihood_ratio_test(pm, n_simulations = 400, precision = 0., batch_size = 100,
+                                   max_workers = 2, seed = 2)
+    assert serial == pooled
+    assert serial[2] == 400
+    assert serial[1] > .01
+
+    pm.chunk_size = 16
+    with pytest.raises(TypeError):
+        likelihood_ratio_test(pm, n_simulations = 100, max_workers = 1)
+
+def test_likelihood_ratio_test_with_exposure():
+    # homogeneous events observed only between phases 0.35 and 0.65
+    exposure = np.zeros(100)
+    exposure[35:65] = 10. / 100
+    rng = np.random.default_rng(3)
+    p_values = []
+    for k in range(40):
+        data = .35 + .3 * rng.random(rng.poisson(60))
+        pm = SPI_Model(major_axis_a = 2., eccentricity = .7, data = data, exposure = exposure,
+                       model = 'inverse_distance_influence')
+        p_values.append(likelihood_ratio_test(pm, n_simulations = 200, precision = 0., batch_size = 200,
+                                              max_workers = 1, seed = k)[1])
+    p_values = np.array(p_values)
+    # the p-values of a true null are roughly uniform
+    assert (p_values < .05).mean() < .2
+    assert .25 < (p_values < .5).mean() < .75
+
+def test_likelihood_ratio_test_binned():
+    # homogeneous events, coarse bins
+    rng = np.random.default_rng(5)
+    p_values = {None: [], 4: []}
+    for k in range(40):
+        data = rng.random(rng.poisson(80))
+        for n_bins in p_values:
+            pm = SPI_Model(major_axis_a = 2., eccentricity = .7, data = data, n_orbits = 10,
+                           n_bins = n_bins, model = 'inverse_distance_influence')
+            p_values[n_bins].append(likelihood_ratio_test(pm, n_simulations = 200, precision = 0., batch_size = 200,
+                                                          max_workers = 1, seed = k)[1])
+    unbinned, binned = np.array(p_values[None]), np.array(p_values[4])
+    # the binned p-values of a true null are roughly uniform too
+    assert (binned < .05).mean() < .2
+    assert .25 < (binned < .5).mean() < .75
+    assert abs(binned.mean() - unbinned.mean()) < .15
+
+def test_simulate_null_statistics_binned():
+    # the binned null statistics are those of the binned simulated phases
+    shape = shape_inverse_distance_influence
+    compensator = orbit_compensator(shape, .8, 2., 10)
+    null = simulate_null_statistics(7, 20, 50., shape, .8, 2., compensator, n_bins = 8)
+    rng = np.random.default_rng(7)
+    n_events = rng.poisson(50., size = 20)
+    phases = rng.random((20, n_events.max()))
+    counts = np.array([bin_phases(phases[i, :n], 8) for i, n in enumerate(n_events)])
+    bin_shape = np.tile(8 * shape_bin_integrals(shape, .8, 2., 8), (20, 1))
+    expected = likelihood_ratio_statistic(bin_shape, counts, np.tile(compensator, (20, 1)))
+    assert null == pytest.approx(expected)
@@ -2,6 +2,7 @@ import pytest
 import types
 from inspect import signature
 import numpy as np
+from scipy.integrate import quad
 
 from ..spimodel import SPI_Model
 
@@ -82,4 +83,203 @@ def test_integration():
     
     
     
-    
\ No newline at end of file
+    
+def test_compensator_matches_numerical_integration():
+    for model in ['absolute_distance_influence', 'inverse_distance_influence']:
+        for major_axis_a in [None, 1.5]:
+            pm = SPI_Model(major_axis_a = major_axis_a, eccentricity = 0.5, data = np.linspace(0,1,10), model = model, n_orbits = 3)
+            intensity = pm.intensity_function()
+            parameters = [1.,2.]
+            data_term = -np.log(intensity(pm.data, 1., 2., pm.eccentricity, pm.major_axis_a)).sum()
+            compensator = 3*quad(lambda x: intensity(x, 1., 2., pm.eccentricity, pm.major_axis_a), 0, 1)[0]
+            assert pm._negative_likelihood_function(parameters) == pytest.approx(data_term + compensator)
+
+def test_negative_likelihood_gradient_and_hessian():
+    for model in ['absolute_distance_influence', 'inverse_distance_influence']:
+        for major_axis_a in [None, 1.5]:
+            pm = SPI_Model(major_axis_a = major_axis_a, eccentricity = 0.5, data = np.linspace(0,1,10), model = model, n_orbits = 3)
+            parameters = np.array([1.,2.])
+            epsilon = 1e-6
+            gradient = pm._negative_likelihood_gradient(parameters)
+            hessian = pm._negative_likelihood_hessian(parameters)
+            for i, step in enumerate(np.eye(2) * epsilon):
+                numerical = (pm._negative_likelihood_function(parameters + step) -
+                             pm._negative_likelihood_function(parameters - step)) / (2 * epsilon)
+                assert gradient[i] == pytest.approx(numerical, rel=1e-5)
+                numerical = (pm._negative_likelihood_gradient(parameters + step) -
+                             pm._negative_likelihood_gradient(parameters - step)) / (2 * epsilon)
+                assert hessian[i] == pytest.approx(numerical, rel=1e-5)
+    
+def test_standard_errors():
+    pm = SPI_Model(major_axis_a = None, eccentricity = 0.5, data = np.linspace(0,1,10), n_orbits = 1)
+    errors = pm.standard_errors()
+    assert pm.MLE_params is not None
+    assert errors.shape == (2,)
+    assert (errors > 0).all()
+
+def test_seeded_thinning():
+    data = np.random.rand(50)
+    memberships = []
+    for seed in [3, 3]:
+        pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 1)
+        pm.thinning(seed = seed)
+        memberships.append(pm.inhom)
+    assert memberships[0] == memberships[1]
+
+def test_thinning_realizations():
+    data = np.concatenate([np.random.rand(40), np.random.normal(.5, .03, 20) % 1])
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 4)
+    fraction = pm.thinning(seed = 1, n_realizations = 2000)
+    assert pm.inhom_mask.shape == (2000, 60)
+    assert fraction == pytest.approx(pm.inhom_probability, abs=0.05)
+    assert ((pm.inhom_probability >= 0) & (pm.inhom_probability <= 1)).all()
+    # hom and inhom are the first draw
+    assert sorted(pm.inhom) == sorted(data[pm.inhom_mask[0]])
+    assert len(pm.hom) + len(pm.inhom) == len(data)
+    # thinning again replaces the previous draw
+    pm.thinning(seed = 2)
+    assert len(pm.hom) + len(pm.inhom) == len(data)
+
+def test_compile():
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = np.linspace(0,1,10), n_orbits = 1)
+    compiled = pm.compile()
+    assert pm.compile() is compiled
+    # changing the orbit or the data recompiles
+    pm.eccentricity = 0.3
+    assert pm.compile() is not compiled
+    compiled = pm.compile()
+    pm.data = np.linspace(0,1,20)
+    assert pm.compile().shape.shape == (20,)
+
+def test_profile_likelihood():
+    np.random.seed(3)
+    data = np.concatenate([np.random.rand(50), np.random.normal(.7, .03, 30) % 1])
+    pm = SPI_Model(major_axis_a = 2., eccentricity = 0.5, data = data, model = 'inverse_distance_influence', n_orbits = 10)
+    eccentricities, phase_shifts = [.1, .5, .9], np.linspace(0, 1, 20, endpoint=False)
+    log_likelihood, params = pm.profile_likelihood(eccentricities, phase_shifts)
+    assert log_likelihood.shape == (3, 20)
+    assert params.shape == (3, 20, 2)
+    # without shift, the profile is the maximum likelihood of the fixed orbit
+    assert -log_likelihood[1, 0] <= pm._negative_likelihood_function(pm.estimate_two_parameters()) + 1e-8
+    assert log_likelihood[1, 0] == pytest.approx(-pm._negative_likelihood_function(params[1, 0]))
+    # the cluster at phase .7 is found with a shift of about .2 from periastron at .5
+    best = np.unravel_index(np.argmax(log_likelihood), log_likelihood.shape)
+    assert phase_shifts[best[1]] == pytest.approx(.2, abs=.051)
+    with pytest.raises(KeyError):
+        pm.profile_likelihood([1.5])
+
+def test_chunked_data(tmp_path):
+    np.random.seed(5)
+    data = np.concatenate([np.random.rand(300), np.random.normal(.5, .05, 100) % 1])
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 10)
+    expected = pm.estimate_two_parameters()
+    memmap = np.memmap(tmp_path / "phases.bin", dtype=float, mode="w+", shape=data.shape)
+    memmap[:] = data
+    for chunked_data, chunk_size in [(memmap, None), ([data[:150], data[150:]], 64), (data, 64)]:
+        pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = chunked_data, n_orbits = 10,
+                       chunk_size = chunk_size)
+        assert pm.estimate_two_parameters() == pytest.approx(expected, rel=1e-4)
+        pm.thinning(seed = 1)
+        assert len(pm.hom) + len(pm.inhom) == len(data)
+        with pytest.raises(TypeError):
+            pm.profile_likelihood([.5])
+
+def test_sequence_data():
+    # plain lists and tuples of phases are not chunks
+    np.random.seed(8)
+    data = np.concatenate([np.random.rand(60), np.random.normal(.5, .05, 20) % 1])
+    expected = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 10).estimate_two_parameters()
+    for sequence in [list(data), tuple(data)]:
+        pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = sequence, n_orbits = 10)
+        assert not pm._chunked()
+        assert pm.estimate_two_parameters() == pytest.approx(expected)
+        pm.profile_likelihood([.5])
+        pm.n_bins = 50
+        assert pm.estimate_two_parameters() == pytest.approx(expected, rel=.1)
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = [.1, .5, .9], n_orbits = 1, chunk_size = 2)
+    assert pm.compile().n_events == 3
+
+def test_binned_likelihood():
+    np.random.seed(6)
+    data = np.concatenate([np.random.rand(3000), np.random.normal(.5, .05, 1000) % 1])
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 10)
+    expected = pm.estimate_two_parameters()
+    binned = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 10, n_bins = 500)
+    assert binned.estimate_two_parameters() == pytest.approx(expected, rel=1e-2)
+    assert binned.compile().shape.shape == (500,)
+    assert binned.standard_errors() == pytest.approx(pm.standard_errors(), rel=1e-2)
+    binned.thinning(seed = 1)
+    assert len(binned.hom) + len(binned.inhom) == len(data)
+    # switching back to the exact likelihood
+    binned.n_bins = None
+    assert binned.estimate_two_parameters() == pytest.approx(expected)
+
+def test_update():
+    np.random.seed(7)
+    data = np.concatenate([np.random.rand(3000), np.random.normal(.5, .05, 1000) % 1])
+    np.random.shuffle(data)
+    for kwargs in [{}, {"n_bins": 200}, {"chunk_size": 512}]:
+        pm = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data[:100], n_orbits = 1, **kwargs)
+        compiled = pm.compile()
+        for start in range(100, 4000, 300):
+            params = pm.update(data[start:start + 300], n_orbits = 1)
+        # the compiled model was extended, not rebuilt
+        assert pm.compile() is compiled
+        assert pm.n_orbits == 14
+        full = SPI_Model(major_axis_a = 1.5, eccentricity = 0.5, data = data, n_orbits = 14, **kwargs)
+        assert params == pytest.approx(full.estimate_two_parameters(), rel=1e-4)
+        assert pm.MLE_params == params
+        pm.thinning(seed = 1)
+        assert len(pm.hom) + len(pm.inhom) == 4000
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_nan_inputs():
+    data = np.random.rand(50)
+    bad = data.copy()
+    bad[3] = np.nan
+    for kwargs in [{}, {"n_bins": 20}, {"chunk_size": 16}]:
+        with pytest.raises(ValueError, match="NaN-value detected"):
+            SPI_Model(eccentricity = .5, data = bad, n_orbits = 2, **kwargs).estimate_two_parameters()
+        for eccentricity, major_axis_a in [(np.nan, None), (.5, np.nan)]:
+            pm = SPI_Model(major_axis_a = major_axis_a, eccentricity = eccentricity, data = data, n_orbits = 2,
+                           **kwargs)
+            with pytest.raises(ValueError, match="NaN-value detected"):
+                pm._negative_likelihood_function([1., 1.])
+
+def test_compiled_model_follows_data():
+    np.random.seed(8)
+    data = np.concatenate([np.random.rand(200), np.random.normal(.5, .05, 100) % 1])
+    phases = np.random.rand(300)
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = .5, data = data, n_orbits = 10)
+    before = pm.estimate_two_parameters()
+    # the model keeps a read-only copy of the data
+    data[:] = phases
+    with pytest.raises(ValueError):
+        pm.data[:] = phases
+    assert pm.estimate_two_parameters() == pytest.approx(before)
+    pm.data = phases
+    expected = SPI_Model(major_axis_a = 1.5, eccentricity = .5, data = phases, n_orbits = 10)
+    assert pm.estimate_two_parameters() == pytest.approx(expected.estimate_two_parameters())
+    exposure = np.full(10, 1.)
+    pm.exposure = exposure
+    exposure[:] = 0.
+    assert pm.compile().compensator[0] == pytest.approx(10.)
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test_update_from_empty_model():
+    np.random.seed(9)
+    data = np.concatenate([np.random.rand(300), np.random.normal(.5, .05, 100) % 1])
+    for kwargs in [{}, {"n_bins": 100}]:
+        assert SPI_Model(eccentricity = .5, n_orbits = 1, **kwargs).compile().weights.sum() == 0
+        pm = SPI_Model(eccentricity = .5, **kwargs)
+        pm.update(data[:200], n_orbits = 5)
+        params = pm.update(data[200:], n_orbits = 5)
+        full = SPI_Model(eccentricity = .5, data = data, n_orbits = 10, **kwargs)
+        assert params == pytest.approx(full.estimate_two_parameters(), rel=1e-4)
+
+def test_gradient_function():
+    pm = SPI_Model(major_axis_a = 1.5, eccentricity = .5, model = 'inverse_distance_influence')
+    time = np.linspace(0, 1, 5)
+    gradient = pm.gradient_function()(time, 1., 2., .5, 1.5)
+    assert gradient[1] == pytest.approx(pm.shape_function()(time, .5, 1.5))
+    assert (gradient[0] == 1.).all()
@@ -0,0 +1,51 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+from ..campaign import CampaignWriter
+from ..sweep import make_grid, run_sweep, run_realization, task_seed, RESULT_COLUMNS
+
+def test_make_grid():
+    grid = make_grid(period=[5, 10], eccentricity=[.3], phase=[.5, .7], width=[.02],
+                     size=[5], flares_per_day=[.5], n_realizations=3)
+    assert len(grid) == 2 * 2 * 3
+    assert grid[0] == {"period": 5, "eccentricity": .3, "phase": .5, "width": .02,
+                       "size": 5, "flares_per_day": .5, "realization": 0}
+
+def test_task_seed():
+    assert task_seed(1, 3) == task_seed(1, 3)
+    assert task_seed(1, 3) != task_seed(1, 4)
+    assert task_seed(1, 3) != task_seed(2, 3)
+
+def test_run_sweep(tmp_path):
+    grid = make_grid(period=[5], eccentricity=[.3], phase=[.5], width=[.02],
+                     size=[3, 0], flares_per_day=[.5], n_realizations=2)
+    serial, pooled = tmp_path / "serial.csv", tmp_path / "pooled.csv"
+    assert run_sweep(grid, path=serial, observation_deltat=30, seed=7, max_workers=1) == 4
+    assert run_sweep(grid, path=pooled, observation_deltat=30, seed=7, max_workers=2) == 4
+    serial, pooled = pd.read_csv(serial), pd.read_csv(pooled)
+    assert list(serial.columns) == RESULT_COLUMNS
+    # results do not depend on how the tasks are distributed
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert (serial.n_hom + serial.n_inhom == serial.n_flares).all()
+    assert (serial.loc[serial["size"] == 0, "n_spi"] == 0).all()
+
+    # a single realization can be re-run from its row
+    row = serial.iloc[1]
+    task = dict(row[["period", "eccentricity", "phase", "width", "size", "flares_per_day",
+                     "realization", "seed", "task"]])
+    task["size"] = int(task["size"])
+    task.update({"observation_deltat": 30, "cadence": 6, "first_observation_time": 0.,
+                 "major_axis_a": 1., "model": "absolute_distance_influence"})
+    assert run_realization(task)["n_flares"] == row.n_flares
+
+def test_run_sweep_closes_campaign(tmp_path, monkeypatch):
+    closed = []
+    monkeypatch.setattr(CampaignWriter, "close", lambda self: closed.append(self))
+    grid = make_grid(period=[5], eccentricity=[.3], phase=[.5], width=[.02],
+                     size=[3], flares_per_day=[.5], n_realizations=1)
+    # the result file cannot be opened
+    with pytest.raises(OSError):
+        run_sweep(grid, path=tmp_path / "missing" / "sweep.csv", observation_deltat=30,
+                  campaign=tmp_path / "campaign", max_workers=1)
+    assert len(closed) == 1
@@ -1,7 +1,9 @@
+import os
 import pytest
+import pandas as pd
 import numpy as np
 
-from ..synthetic import SyntheticFlares, HotJupiterHost
+from ..synthetic import SyntheticFlares, HotJupiterHost, read_synthetic_flare_table
 
 def test_init_SyntheticFlares():
     sf = SyntheticFlares(hjhost=HotJupiterHost(period=1, first_periastron_time=1), observation_deltat=10,
@@ -146,3 +148,153 @@ def test_merge_spi_and_instrinsic_flares():
     assert (sf.all_flares.peak_time.values == [3,4,5,0,1,2]).all()
     assert (sf.all_flares.source.values == ["intrinsic", "intrinsic", "intrinsic",
                                             "spi", "spi", "spi"]).all()
+
+def test_seeded_synthetic_flares():
+    attribs = {"observation_deltat":10,
+               "first_observation_time":0,
+               "cadence":1,
+               "flares_per_day":1}
+    tables = []
+    for seed in [5, 5, np.random.SeedSequence(5), 6]:
+        sf = SyntheticFlares(hjhost=HotJupiterHost(period=1), seed=seed, **attribs)
+        sf.generate_synthetic_flares(phase=0.5, size=2, width=0.1)
+        tables.append(sf.all_flares)
+    # same seed, same flares
+    assert tables[0].equals(tables[1])
+    assert tables[0].equals(tables[2])
+    assert not tables[0].equals(tables[3])
+
+    # a shared Generator is advanced, not reset
+    rng = np.random.default_rng(5)
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=1), seed=rng, **attribs)
+    assert sf.rng is rng
+
+def test__spi_flares_gauss_snapping():
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=1, first_periastron_time=1),
+                         observation_deltat=10,
+                         first_observation_time=0,
+                         cadence=1, flares_per_day=1, seed=1)
+    sf._spi_flares_gauss(phase=0.5, width=0.3, size=20)
+    # flares sit on observation times, sorted and without duplicates
+    assert np.isin(sf.spi_flare_peak_times, sf.observation_time).all()
+    assert (np.diff(sf.spi_flare_peak_times) > 0).all()
+
+def test_lazy_observation_time():
+    attribs = {"hjhost":HotJupiterHost(period=1, first_periastron_time=1),
+               "observation_deltat":10,
+               "first_observation_time":0,
+               "cadence":1,
+               "flares_per_day":2}
+    sf = SyntheticFlares(lazy=True, seed=2, **attribs)
+    assert sf.observation_time is None
+    assert sf.observation_grid == (0, 1./24., 241)
+    sf.generate_synthetic_flares(phase=0.5, size=3, width=0.1)
+    # flares fall on the same grid as in the materialized mode
+    eager = SyntheticFlares(**attribs)
+    assert np.isin(sf.all_flares.peak_time.values, eager.observation_time).all()
+    assert not sf.all_flares.peak_time.duplicated().any()
+
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=1), observation_deltat=10,
+                         cadence=1, flares_per_day=2, lazy=True, seed=2)
+    assert 0 <= sf.hjhost.first_periastron_time < 1
+
+def test_merge_ambiguous_flares():
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=1, first_periastron_time=1),
+                         observation_deltat=10, first_observation_time=0,
+                         cadence=1, flares_per_day=1)
+    sf.flare_peak_times = np.array([3, 4, 5, 6])
+    sf.spi_flare_peak_times = np.array([1, 4, 6, 7])
+    sf.merge_spi_and_instrinsic_flares()
+    assert (sf.all_flares.peak_time.values == [3, 4, 5, 6, 1, 7]).all()
+    assert (sf.all_flares.source.values == ["intrinsic", "ambiguous", "intrinsic",
+                                            "ambiguous", "spi", "spi"]).all()
+
+def test_write_and_read_synthetic_flare_table(tmp_path):
+    sf = SyntheticFlares(hjhost=HotJupiterHost(period=2, e=.4, a=.5),
+                         observation_deltat=10, first_observation_time=3,
+                         cadence=2, flares_per_day=1, seed=4)
+    sf.generate_synthetic_flares(phase=0.5, size=3, width=0.1)
+    for name in ["flares.npz", "flares.csv"]:
+        sf.write_out_synthetic_flare_table(tmp_path / name)
+        restored = read_synthetic_flare_table(tmp_path / name)
+        pd.testing.assert_frame_equal(restored.all_flares.reset_index(drop=True),
+                                      sf.all_flares.reset_index(drop=True), check_dtype=False)
+        assert restored.hjhost.period == sf.hjhost.period
+        assert restored.hjhost.first_periastron_time == sf.hjhost.first_periastron_time
+        assert restored.observation_grid == pytest.approx(sf.observation_grid)
+        assert restored.flares_per_day == sf.flares_per_day
+    # only the binary format keeps the orbit
+    restored = read_synthetic_flare_table(tmp_path / "flares.npz")
+    assert (restored.hjhost.eccentricity, restored.hjhost.major_axis_a) == (.4, .5)
+
+def test_read_synthetic_flare_table_from_synth():
+    path = os.path.join(os.path.dirname(__file__), "..", "..", "synth",
+                        "000_eccentric_hjhost_with_flares.csv")
+    sf = read_synthetic_flare_table(path)
+    assert sf.hjhost.period == pytest.approx(3.60458738457631)
+    assert sf.cadence == 60
+    assert list(sf.all_flares.columns) == ["source", "peak_time"]
+
+@pytest.mark.filterwarnings("ignore::UserWarning")
+def test__spi_flares_intensity():
+    from ..spimodel import SPI_Model
+    hjhost = HotJupiterHost(e=.5, period=2., first_periastron_time=.3)
+    sf = SyntheticFlares(hjhost=hjhost, observation_deltat=2000, cadence=2,
+                         flares_per_day=.1, seed=4, lazy=True)
+    sf.generate_spi_flares(model="Intensity", peak=1., base=.5, batch_size=1000)
+    times = sf.spi_flare_peak_times
+    assert (np.diff(times) > 0).all()
+    assert times.min() >= 0. and times.max() <= 2000.
+
+    # the fitted model recovers the simulated intensity per orbit
+    phases = ((times - hjhost.first_periastron_time) / hjhost.period + .5) % 1.
+    pm = SPI_Model(eccentricity=.5, data=phases, n_orbits=1000)
+    base, peak = pm.estimate_two_parameters()
+    assert base == pytest.approx(1., rel=.15)
+    assert peak == pytest.approx(2., rel=.15)
+
+    # seeded draws are reproducible
+    sf2 = SyntheticFlares(hjhost=HotJupiterHost(e=.5, period=2., first_periastron_time=.3),
+                          observation_deltat=2000, cadence=2, flares_per_day=.1, seed=4, lazy=True)
+    sf2.generate_spi_flares(model="Intensity", peak=1., base=.5, batch_size=1000)
+    assert (sf2.spi_flare_peak_times == times).all()
+
+    with pytest.raises(KeyError):
+        sf.generate_spi_flares(model="Intensity", peak=1., intensity_model="none")
+
+def test_stacked_intensity_flares():
+    # injected and fitted models agree on the stacked peak times,
+    # with a periastron that is not at the first observation
+    from ..spimodel import SPI_Model
+    hjhost = HotJupiterHost(e=.7, period=2., first_periastron_time=.7)
+    sf = SyntheticFlares(hjhost=hjhost, observation_deltat=6000, cadence=2,
+                         flares_per_day=.5, seed=1, lazy=True)
+    sf.generate_synthetic_flares(model="Intensity", peak=2., base=.5,
+                                 intensity_model="inverse_distance_influence")
+    pm = SPI_Model(eccentricity=.7, data=sf.all_flares.stacked_peak_time.values, n_orbits=3000,
+                   model="inverse_distance_influence")
+    base, peak = pm.estimate_two_parameters()
+    # intrinsic and SPI base rates add up, per orbit of two days
+    assert base == pytest.approx(2., rel=.1)
+    assert peak == pytest.approx(4., rel=.15)
+    eccentricities = np.linspace(.1, .9, 17)
+    log_likelihood, _ = pm.profile_likelihood(eccentricities)
+    assert eccentricities[log_likelihood[:, 0].argmax()] == pytest.approx(.7, abs=.15)
+
+def test_exposure_of_partial_orbits():
+    # uniform flares over 2.5 orbits, the periastron phases are
+    # observed three times and the apastron phases twice
+    from ..spimodel import SPI_Model
+    hjhost = HotJupiterHost(e=.7, period=100., first_periastron_time=25.)
+    sf = SyntheticFlares(hjhost=hjhost, observation_deltat=250, cadence=.5,
+                         flares_per_day=4, seed=0, lazy=True)
+    sf.generate_synthetic_flares(model="Intensity", peak=0., base=0.,
+                                 intensity_model="inverse_distance_influence")
+    assert sf.exposure().sum() == pytest.approx(2.5)
+    data = sf.all_flares.stacked_peak_time.values
+    pm = SPI_Model(eccentricity=.7, data=data, exposure=sf.exposure(), model="inverse_distance_influence")
+    peak, error = pm.estimate_two_parameters()[1], pm.standard_errors()[1]
+    assert peak < 2 * error
+    # without the exposure, the extra coverage looks like a peak
+    pm = SPI_Model(eccentricity=.7, data=data, n_orbits=2.5, model="inverse_distance_influence")
+    assert pm.estimate_two_parameters()[1] > 3 * error